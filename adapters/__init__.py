@@ -1,6 +1,20 @@
+from importlib import import_module
+
 from .base import DatabaseAdapter
-from .mariadb import MariaDBAdapter
-from .neo4j import Neo4jAdapter
+from .memory import InMemoryAdapter
+from .partitioned import PartitionedAdapter
+from .profiling import Profiler
+from .reach_index import ReachabilityIndex
+from .snapshot import load_snapshot
+
+# Adaptateurs dont le driver n'est importé qu'au premier accès (moteurs en processus utilisables sans)
+_LAZY = {'MariaDBAdapter': '.mariadb', 'SCHEMA_LAYOUTS': '.mariadb', 'Neo4jAdapter': '.neo4j'}
+
+__all__ = ['DatabaseAdapter', 'InMemoryAdapter', 'MariaDBAdapter', 'Neo4jAdapter', 'PartitionedAdapter',
+           'Profiler', 'ReachabilityIndex', 'SCHEMA_LAYOUTS', 'load_snapshot']
 
-__all__ = ['DatabaseAdapter', 'MariaDBAdapter', 'Neo4jAdapter']
 
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_LAZY[name], __name__), name)
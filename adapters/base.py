@@ -1,7 +1,53 @@
 from abc import ABC, abstractmethod
+from .profiling import null_phase
+from .snapshot import CHUNK_SIZE, FIELDS, SnapshotWriter
 
 
 class DatabaseAdapter(ABC):
+    reach_index = None
+    profiler = None
+
+    def _phase(self, name):
+        """Phase mesurée par le profiler de l'application, s'il y en a un"""
+        if self.profiler is None:
+            return null_phase(name)
+        return self.profiler.phase(name)
+
+    def set_reach_index(self, index):
+        self.reach_index = index
+
+    def read_catalog(self):
+        return None
+
+    def resource_usage(self):
+        """CPU et RSS cumulés des processus auxiliaires du moteur ({'cpu', 'rss_mb'}), None s'il n'y en a pas"""
+        return None
+
+    def warm_up(self):
+        """Parcourt follows et purchases pour charger les caches de la base (rien à faire en processus)"""
+        pass
+
+    def cold_start(self):
+        """Vide les caches de la base si possible ; False si l'état froid n'est pas reproductible"""
+        return False
+
+    def cache_counters(self):
+        """Compteurs cumulés {'hits', 'misses'} du cache de la base, ou None si non disponibles"""
+        return None
+
+    def iter_entity(self, entity, chunk_size):
+        """Lignes (tuples) d'une entité du dataset, lues en flux par blocs d'au plus chunk_size"""
+        raise NotImplementedError(f"{type(self).__name__} ne supporte pas l'export")
+
+    def export_snapshot(self, filepath, chunk_size=CHUNK_SIZE):
+        """Copie les données de la base dans un snapshot portable, en mémoire bornée"""
+        header = {'source': type(self).__name__, 'catalog': self.read_catalog()}
+        with SnapshotWriter(filepath, header) as writer:
+            for entity in FIELDS:
+                for rows in self.iter_entity(entity, chunk_size):
+                    writer.write(entity, rows)
+        return writer.counts
+
     @abstractmethod
     def connect(self):
         pass
@@ -15,11 +61,34 @@ class DatabaseAdapter(ABC):
         """Liste des produits commandés par les cercles de followers (niveau 1..n)"""
         pass
 
+    @abstractmethod
+    def query_1_top_products(self, user_id, depth, limit, after=None):
+        """Top-k des produits de la requête 1, triés par (buyers_count DESC, id ASC).
+
+        `after` est le curseur (buyers_count, id) de la dernière ligne de la page précédente.
+        """
+        pass
+
+    @abstractmethod
+    def iter_query_1_products_by_followers(self, user_id, depth, batch_size=1000):
+        """Même résultat que la requête 1, trié, lu en flux par paquets de `batch_size` lignes"""
+        pass
+
     @abstractmethod
     def query_2_specific_product_influence(self, user_id, product_id, depth):
         """Rôle d'influenceur pour un produit spécifique sur les followers"""
         pass
 
+    @abstractmethod
+    def query_1_batch(self, user_ids, depth):
+        """Requête 1 pour plusieurs influenceurs en un seul aller-retour: {user_id: [lignes triées]}"""
+        pass
+
+    @abstractmethod
+    def query_2_batch(self, user_ids, product_ids, depth):
+        """Requête 2 pour chaque couple (influenceur, produit) en un seul aller-retour: {user_id: {product_id: buyers_count}}"""
+        pass
+
     @abstractmethod
     def query_3_viral_product_disk(self, product_id, level):
         """Pour un produit donné, nombre de personnes l'ayant commandé dans un disque orienté de niveau n (produits viraux)"""
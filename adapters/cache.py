@@ -0,0 +1,43 @@
+import shutil
+import subprocess
+import time
+
+RESTART_TIMEOUT = 180
+
+
+def container_available(container):
+    """Vrai si docker est installé et que le conteneur local existe"""
+    if shutil.which("docker") is None:
+        return False
+    return subprocess.run(["docker", "inspect", container], capture_output=True).returncode == 0
+
+
+def restart_container(container, reconnect, timeout=RESTART_TIMEOUT):
+    """Redémarre le conteneur docker local puis reconnecte l'adaptateur dès que le serveur répond.
+
+    La connexion doit être fermée avant l'appel ; en cas d'échec du redémarrage, une reconnexion est tentée.
+    """
+    try:
+        subprocess.run(["docker", "restart", container], check=True, capture_output=True)
+    except Exception:
+        reconnect()
+        raise
+    deadline = time.time() + timeout
+    while True:
+        try:
+            reconnect()
+            return
+        except Exception:
+            if time.time() > deadline:
+                raise
+            time.sleep(1)
+
+
+def cache_delta(before, after):
+    """Hits, misses et taux de hit du cache entre deux relevés de compteurs (None si non disponibles)"""
+    if before is None or after is None:
+        return None
+    hits = after['hits'] - before['hits']
+    misses = after['misses'] - before['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else None}
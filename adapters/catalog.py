@@ -0,0 +1,34 @@
+import hashlib
+import json
+import time
+from array import array
+
+FINGERPRINT_CHUNK = 100_000
+
+
+def dataset_fingerprint(data):
+    """Empreinte blake2b des identifiants (users, products, follows, purchases) dans l'ordre du dataset"""
+    h = hashlib.blake2b(digest_size=16)
+    for key, fields in (('users', ('id',)), ('products', ('id',)),
+                        ('follows', ('follower_id', 'followee_id')), ('purchases', ('user_id', 'product_id'))):
+        rows = data[key]
+        h.update(f"{key}:{len(rows)};".encode())
+        for i in range(0, len(rows), FINGERPRINT_CHUNK):
+            chunk = array('q', (row[f] for row in rows[i:i + FINGERPRINT_CHUNK] for f in fields))
+            h.update(chunk.tobytes())
+    return h.hexdigest()
+
+
+def catalog_for(data):
+    """Catalogue du dataset (comptes, empreinte, paramètres du générateur), calculé une seule fois par dataset"""
+    if 'catalog' not in data:
+        data['catalog'] = {
+            'users': len(data['users']),
+            'products': len(data['products']),
+            'follows': len(data['follows']),
+            'purchases': len(data['purchases']),
+            'fingerprint': dataset_fingerprint(data),
+            'params': json.dumps(data.get('params') or {}),
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+    return data['catalog']
@@ -1,5 +1,8 @@
 import mysql.connector
+from itertools import islice
 from .base import DatabaseAdapter
+from .cache import container_available, restart_container
+from .catalog import catalog_for
 from tqdm import tqdm
 
 MARIADB_CONFIG = {
@@ -10,10 +13,107 @@ MARIADB_CONFIG = {
     'port': 3306
 }
 
+MARIADB_CONTAINER = 'tp_mariadb'
+
 BATCH_SIZE = 10000
+# Sources d'un lot partageant un même masque BIT_OR (BIGINT UNSIGNED)
+SOURCE_BITS = 64
+WARM_TABLES = ('follows', 'purchases', 'products')
+
+EXPORT_QUERIES = {
+    'users': "SELECT id, name FROM users",
+    'products': "SELECT id, name FROM products",
+    'follows': "SELECT follower_id, followee_id FROM follows",
+    'purchases': "SELECT user_id, product_id FROM purchases"
+}
+
+# Variantes de schéma pour follows / purchases, choisies au chargement.
+# Les requêtes récursives parcourent followee_id -> follower_id puis user_id -> product_id.
+SCHEMA_LAYOUTS = {
+    'default': {
+        'description': "PK (follower, followee) + index simples redondants (schéma d'origine)",
+        'follows': """
+            PRIMARY KEY (follower_id, followee_id),
+            INDEX idx_followee (followee_id),
+            INDEX idx_follower (follower_id)
+        """,
+        'purchases': """
+            PRIMARY KEY (user_id, product_id),
+            INDEX idx_product (product_id),
+            INDEX idx_user (user_id)
+        """
+    },
+    'minimal': {
+        'description': "Index redondants avec le préfixe de la PK supprimés",
+        'follows': """
+            PRIMARY KEY (follower_id, followee_id),
+            INDEX idx_followee (followee_id)
+        """,
+        'purchases': """
+            PRIMARY KEY (user_id, product_id),
+            INDEX idx_product (product_id)
+        """
+    },
+    'followee_clustered': {
+        'description': "follows clusterisé sur (followee, follower)",
+        'follows': """
+            PRIMARY KEY (followee_id, follower_id),
+            INDEX idx_follower (follower_id)
+        """,
+        'purchases': """
+            PRIMARY KEY (user_id, product_id),
+            INDEX idx_product (product_id)
+        """
+    },
+    'surrogate_key': {
+        'description': "PK auto-incrémentée (ordre d'insertion), index secondaires non couvrants",
+        # Un index secondaire InnoDB ne contient que ses colonnes + la PK : ici (followee_id, id),
+        # chaque follower trouvé via idx_followee demande une lecture dans l'index clusterisé
+        'follows': """
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            UNIQUE KEY uk_follow (follower_id, followee_id),
+            INDEX idx_followee (followee_id)
+        """,
+        'purchases': """
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            UNIQUE KEY uk_purchase (user_id, product_id),
+            INDEX idx_product (product_id)
+        """
+    },
+    'product_clustered': {
+        'description': "follows clusterisé par followee, purchases clusterisé par produit",
+        'follows': """
+            PRIMARY KEY (followee_id, follower_id),
+            INDEX idx_follower (follower_id)
+        """,
+        'purchases': """
+            PRIMARY KEY (product_id, user_id),
+            INDEX idx_user_product (user_id, product_id)
+        """
+    },
+    'hash_partitioned': {
+        'description': "follows clusterisé par followee, partitions HASH par utilisateur",
+        'follows': """
+            PRIMARY KEY (followee_id, follower_id),
+            INDEX idx_follower (follower_id)
+        """,
+        'follows_options': "PARTITION BY HASH (followee_id) PARTITIONS 16",
+        'purchases': """
+            PRIMARY KEY (user_id, product_id),
+            INDEX idx_product (product_id)
+        """,
+        'purchases_options': "PARTITION BY HASH (user_id) PARTITIONS 16"
+    }
+}
 
 
 class MariaDBAdapter(DatabaseAdapter):
+    def __init__(self, layout='default'):
+        self.layout = layout
+        self.conn = None
+        # Index dont les followers sont matérialisés dans la table reach_index
+        self._reach_table_for = None
+
     def connect(self):
         self.conn = mysql.connector.connect(**MARIADB_CONFIG)
         self.cursor = self.conn.cursor(dictionary=True)
@@ -25,63 +125,133 @@ class MariaDBAdapter(DatabaseAdapter):
         self.cursor.execute("DROP TABLE IF EXISTS follows")
         self.cursor.execute("DROP TABLE IF EXISTS products")
         self.cursor.execute("DROP TABLE IF EXISTS users")
+        self.cursor.execute("DROP TABLE IF EXISTS dataset_catalog")
+        self.cursor.execute("DROP TABLE IF EXISTS reach_index")
+        self._reach_table_for = None
 
-        print("Création des tables...")
+        layout = SCHEMA_LAYOUTS[self.layout]
+        print(f"Création des tables (schéma {self.layout})...")
         self.cursor.execute("CREATE TABLE users (id INT PRIMARY KEY, name VARCHAR(255))")
         self.cursor.execute("CREATE TABLE products (id INT PRIMARY KEY, name VARCHAR(255))")
-        self.cursor.execute("""
+        self.cursor.execute(f"""
                             CREATE TABLE follows (
                                                      follower_id INT,
                                                      followee_id INT,
-                                                     PRIMARY KEY (follower_id, followee_id),
-                                                     INDEX idx_followee (followee_id),
-                                                     INDEX idx_follower (follower_id)
-                            )
+                                                     {layout['follows']}
+                            ) {layout.get('follows_options', '')}
                             """)
-        self.cursor.execute("""
+        self.cursor.execute(f"""
                             CREATE TABLE purchases (
                                                        user_id INT,
                                                        product_id INT,
-                                                       PRIMARY KEY (user_id, product_id),
-                                                       INDEX idx_product (product_id),
-                                                       INDEX idx_user (user_id)
-                            )
+                                                       {layout['purchases']}
+                            ) {layout.get('purchases_options', '')}
                             """)
 
         print("Chargement des utilisateurs...")
-        users_data = [(u['id'], u['name']) for u in data['users']]
-        for i in tqdm(range(0, len(users_data), BATCH_SIZE), desc="Users", unit="batch"):
-            batch = users_data[i:i + BATCH_SIZE]
-            self.cursor.executemany("INSERT INTO users (id, name) VALUES (%s, %s)", batch)
-            self.conn.commit()
+        with self._phase("users"):
+            users_data = [(u['id'], u['name']) for u in data['users']]
+            for i in tqdm(range(0, len(users_data), BATCH_SIZE), desc="Users", unit="batch"):
+                batch = users_data[i:i + BATCH_SIZE]
+                self.cursor.executemany("INSERT INTO users (id, name) VALUES (%s, %s)", batch)
+                self.conn.commit()
 
         print("Chargement des produits...")
-        products_data = [(p['id'], p['name']) for p in data['products']]
-        for i in tqdm(range(0, len(products_data), BATCH_SIZE), desc="Products", unit="batch"):
-            batch = products_data[i:i + BATCH_SIZE]
-            self.cursor.executemany("INSERT INTO products (id, name) VALUES (%s, %s)", batch)
-            self.conn.commit()
+        with self._phase("products"):
+            products_data = [(p['id'], p['name']) for p in data['products']]
+            for i in tqdm(range(0, len(products_data), BATCH_SIZE), desc="Products", unit="batch"):
+                batch = products_data[i:i + BATCH_SIZE]
+                self.cursor.executemany("INSERT INTO products (id, name) VALUES (%s, %s)", batch)
+                self.conn.commit()
 
         print("Chargement des relations de suivi...")
-        follows_data = [(f['follower_id'], f['followee_id']) for f in data['follows']]
-        for i in tqdm(range(0, len(follows_data), BATCH_SIZE), desc="Follows", unit="batch"):
-            batch = follows_data[i:i + BATCH_SIZE]
-            self.cursor.executemany("INSERT INTO follows (follower_id, followee_id) VALUES (%s, %s)", batch)
-            self.conn.commit()
+        with self._phase("follows"):
+            follows_data = [(f['follower_id'], f['followee_id']) for f in data['follows']]
+            for i in tqdm(range(0, len(follows_data), BATCH_SIZE), desc="Follows", unit="batch"):
+                batch = follows_data[i:i + BATCH_SIZE]
+                self.cursor.executemany("INSERT INTO follows (follower_id, followee_id) VALUES (%s, %s)", batch)
+                self.conn.commit()
 
         print("Chargement des achats...")
-        purchases_data = [(p['user_id'], p['product_id']) for p in data['purchases']]
-        for i in tqdm(range(0, len(purchases_data), BATCH_SIZE), desc="Purchases", unit="batch"):
-            batch = purchases_data[i:i + BATCH_SIZE]
-            self.cursor.executemany("INSERT INTO purchases (user_id, product_id) VALUES (%s, %s)", batch)
-            self.conn.commit()
+        with self._phase("purchases"):
+            purchases_data = [(p['user_id'], p['product_id']) for p in data['purchases']]
+            for i in tqdm(range(0, len(purchases_data), BATCH_SIZE), desc="Purchases", unit="batch"):
+                batch = purchases_data[i:i + BATCH_SIZE]
+                self.cursor.executemany("INSERT INTO purchases (user_id, product_id) VALUES (%s, %s)", batch)
+                self.conn.commit()
 
         self.cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
         self.conn.commit()
+
+        print("Écriture du catalogue du dataset...")
+        self._write_catalog(catalog_for(data))
         print("Chargement terminé")
 
-    def query_1_products_by_followers(self, user_id, depth):
-        query = f"""
+    def _write_catalog(self, catalog):
+        self.cursor.execute("""
+                            CREATE TABLE dataset_catalog (
+                                                             id TINYINT PRIMARY KEY,
+                                                             users BIGINT,
+                                                             products BIGINT,
+                                                             follows BIGINT,
+                                                             purchases BIGINT,
+                                                             fingerprint VARCHAR(64),
+                                                             params TEXT,
+                                                             layout VARCHAR(64),
+                                                             created_at DATETIME
+                            )
+                            """)
+        self.cursor.execute("""
+            INSERT INTO dataset_catalog (id, users, products, follows, purchases, fingerprint, params, layout, created_at)
+            VALUES (1, %(users)s, %(products)s, %(follows)s, %(purchases)s, %(fingerprint)s, %(params)s, %(layout)s,
+                    %(created_at)s)
+        """, {**catalog, 'layout': self.layout})
+        self.conn.commit()
+
+    def read_catalog(self):
+        try:
+            self.cursor.execute("SELECT * FROM dataset_catalog WHERE id = 1")
+            row = self.cursor.fetchone()
+        except mysql.connector.Error:
+            return None
+        if row:
+            row.pop('id')
+            row['created_at'] = str(row['created_at'])
+            # Les données en base ont été chargées avec ce schéma
+            if row.get('layout') in SCHEMA_LAYOUTS:
+                self.layout = row['layout']
+        return row
+
+    def set_reach_index(self, index):
+        """Matérialise l'index une fois pour toutes dans la table reach_index (si la base est connectée)"""
+        self.reach_index = index
+        self._reach_table_for = None
+        if index is None or self.conn is None:
+            return
+        self.cursor.execute("DROP TABLE IF EXISTS reach_index")
+        self.cursor.execute("""
+                            CREATE TABLE reach_index (
+                                user_id INT,
+                                level TINYINT,
+                                follower_id INT,
+                                PRIMARY KEY (user_id, level, follower_id)
+                            )
+                            """)
+        rows = index.rows()
+        while batch := list(islice(rows, BATCH_SIZE)):
+            self.cursor.executemany("INSERT INTO reach_index (user_id, level, follower_id) VALUES (%s, %s, %s)", batch)
+        self.conn.commit()
+        self._reach_table_for = index
+
+    def _network_cte(self, user_id, depth):
+        index = self.reach_index
+        if index is not None and index is self._reach_table_for and index.covers(user_id, depth):
+            return f"""
+            WITH UserNetwork AS (
+                SELECT follower_id FROM reach_index WHERE user_id = {user_id} AND level <= {depth}
+            )
+            """
+        return f"""
         WITH RECURSIVE UserNetwork AS (
             SELECT follower_id, 1 as level
             FROM follows
@@ -92,27 +262,57 @@ class MariaDBAdapter(DatabaseAdapter):
             INNER JOIN UserNetwork un ON f.followee_id = un.follower_id
             WHERE un.level < {depth}
         )
-        SELECT p.name, COUNT(DISTINCT un.follower_id) as buyers_count
+        """
+
+    def _query_1_sql(self, user_id, depth, having="", limit=""):
+        return self._network_cte(user_id, depth) + f"""
+        SELECT p.id, p.name, COUNT(DISTINCT un.follower_id) as buyers_count
         FROM UserNetwork un
         JOIN purchases pur ON un.follower_id = pur.user_id
         JOIN products p ON pur.product_id = p.id
-        GROUP BY p.id;
+        GROUP BY p.id
+        {having}
+        ORDER BY buyers_count DESC, p.id
+        {limit};
         """
-        self.cursor.execute(query)
+
+    def query_1_products_by_followers(self, user_id, depth):
+        self.cursor.execute(self._query_1_sql(user_id, depth))
+        return self.cursor.fetchall()
+
+    def query_1_top_products(self, user_id, depth, limit, after=None):
+        having = ""
+        if after is not None:
+            last_count, last_id = after
+            having = f"HAVING buyers_count < {last_count} OR (buyers_count = {last_count} AND p.id > {last_id})"
+        self.cursor.execute(self._query_1_sql(user_id, depth, having, f"LIMIT {limit}"))
         return self.cursor.fetchall()
 
+    def _stream(self, query, batch_size, dictionary=True):
+        """Lecture côté serveur (curseur non bufferisé), par blocs de batch_size lignes"""
+        cursor = self.conn.cursor(dictionary=dictionary, buffered=False)
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            # Un curseur non bufferisé doit être vidé avant d'être fermé
+            while cursor.fetchmany(batch_size):
+                pass
+            cursor.close()
+
+    def iter_query_1_products_by_followers(self, user_id, depth, batch_size=1000):
+        for rows in self._stream(self._query_1_sql(user_id, depth), batch_size):
+            yield from rows
+
+    def iter_entity(self, entity, chunk_size):
+        yield from self._stream(EXPORT_QUERIES[entity], chunk_size, dictionary=False)
+
     def query_2_specific_product_influence(self, user_id, product_id, depth):
-        query = f"""
-        WITH RECURSIVE UserNetwork AS (
-            SELECT follower_id, 1 as level
-            FROM follows
-            WHERE followee_id = {user_id}
-            UNION ALL
-            SELECT f.follower_id, un.level + 1
-            FROM follows f
-            INNER JOIN UserNetwork un ON f.followee_id = un.follower_id
-            WHERE un.level < {depth}
-        )
+        query = self._network_cte(user_id, depth) + f"""
         SELECT COUNT(DISTINCT un.follower_id) as buyers_count
         FROM UserNetwork un
         JOIN purchases pur ON un.follower_id = pur.user_id
@@ -121,6 +321,81 @@ class MariaDBAdapter(DatabaseAdapter):
         self.cursor.execute(query)
         return self.cursor.fetchall()
 
+    def _batch_network_cte(self, user_ids, depth):
+        # Expansion partagée entre les sources du lot : à chaque niveau, un follower n'est développé
+        # qu'une fois par groupe de SOURCE_BITS sources, avec le masque des sources qui l'atteignent
+        sources = " UNION ALL ".join(
+            f"SELECT {int(u)} AS source_id, {i // SOURCE_BITS} AS grp, {1 << (i % SOURCE_BITS)} AS bit"
+            for i, u in enumerate(user_ids)
+        )
+        levels = ["""
+        Level1 AS (
+            SELECT s.grp, f.follower_id, BIT_OR(s.bit) AS mask
+            FROM follows f
+            JOIN Sources s ON f.followee_id = s.source_id
+            GROUP BY s.grp, f.follower_id
+        )"""]
+        for level in range(2, depth + 1):
+            levels.append(f"""
+        Level{level} AS (
+            SELECT l.grp, f.follower_id, BIT_OR(l.mask) AS mask
+            FROM follows f
+            JOIN Level{level - 1} l ON f.followee_id = l.follower_id
+            GROUP BY l.grp, f.follower_id
+        )""")
+        reached = " UNION ALL ".join(f"SELECT grp, follower_id, mask FROM Level{level}" for level in range(1, depth + 1))
+        return f"""
+        WITH Sources AS ({sources}),{",".join(levels)},
+        Network AS (
+            SELECT grp, follower_id, BIT_OR(mask) AS mask
+            FROM ({reached}) reached
+            GROUP BY grp, follower_id
+        ),
+        UserNetwork AS (
+            SELECT s.source_id, n.follower_id
+            FROM Network n
+            JOIN Sources s ON n.grp = s.grp AND n.mask & s.bit <> 0
+        )
+        """
+
+    def query_1_batch(self, user_ids, depth):
+        user_ids = list(dict.fromkeys(user_ids))
+        results = {user_id: [] for user_id in user_ids}
+        if not user_ids:
+            return results
+        query = self._batch_network_cte(user_ids, depth) + """
+        SELECT un.source_id, p.id, p.name, COUNT(DISTINCT un.follower_id) as buyers_count
+        FROM UserNetwork un
+        JOIN purchases pur ON un.follower_id = pur.user_id
+        JOIN products p ON pur.product_id = p.id
+        GROUP BY un.source_id, p.id
+        ORDER BY un.source_id, buyers_count DESC, p.id;
+        """
+        self.cursor.execute(query)
+        for row in self.cursor.fetchall():
+            source_id = row.pop('source_id')
+            results[source_id].append(row)
+        return results
+
+    def query_2_batch(self, user_ids, product_ids, depth):
+        user_ids = list(dict.fromkeys(user_ids))
+        product_ids = list(dict.fromkeys(product_ids))
+        results = {user_id: {product_id: 0 for product_id in product_ids} for user_id in user_ids}
+        if not user_ids or not product_ids:
+            return results
+        pids = ", ".join(str(int(p)) for p in product_ids)
+        query = self._batch_network_cte(user_ids, depth) + f"""
+        SELECT un.source_id, pur.product_id, COUNT(DISTINCT un.follower_id) as buyers_count
+        FROM UserNetwork un
+        JOIN purchases pur ON un.follower_id = pur.user_id
+        WHERE pur.product_id IN ({pids})
+        GROUP BY un.source_id, pur.product_id;
+        """
+        self.cursor.execute(query)
+        for row in self.cursor.fetchall():
+            results[row['source_id']][row['product_id']] = row['buyers_count']
+        return results
+
     def query_3_viral_product_disk(self, product_id, level):
         if level == 0:
             query = f"""
@@ -211,7 +486,11 @@ class MariaDBAdapter(DatabaseAdapter):
         self.cursor.execute(query)
         return self.cursor.fetchall()
 
-    def get_stats(self):
+    def get_stats(self, verify=False):
+        # Lu dans les deux cas : restaure aussi le schéma des données en base
+        catalog = self.read_catalog()
+        if catalog and not verify:
+            return catalog
         try:
             self.cursor.execute("SELECT COUNT(*) as cnt FROM users")
             users = self.cursor.fetchone()['cnt']
@@ -225,6 +504,34 @@ class MariaDBAdapter(DatabaseAdapter):
         except Exception:
             return None
 
+    def warm_up(self):
+        # Un COUNT(*) forcé sur chaque index parcourt toutes ses pages dans le buffer pool
+        for table in WARM_TABLES:
+            self.cursor.execute(
+                "SELECT DISTINCT INDEX_NAME AS name FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))
+            for index in [row['name'] for row in self.cursor.fetchall()]:
+                self.cursor.execute(f"SELECT COUNT(*) AS cnt FROM {table} FORCE INDEX (`{index}`)")
+                self.cursor.fetchall()
+
+    def cold_start(self):
+        if not container_available(MARIADB_CONTAINER):
+            return False
+        # Sans dump à l'arrêt, le buffer pool n'est pas rechargé au redémarrage
+        self.cursor.execute("SET GLOBAL innodb_buffer_pool_dump_at_shutdown = OFF")
+        self.close()
+        restart_container(MARIADB_CONTAINER, self.connect)
+        self.cursor.execute("SET GLOBAL innodb_buffer_pool_load_abort = ON")
+        return True
+
+    def cache_counters(self):
+        self.cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN "
+                            "('Innodb_buffer_pool_read_requests', 'Innodb_buffer_pool_reads')")
+        status = {row['Variable_name']: int(row['Value']) for row in self.cursor.fetchall()}
+        # read_requests compte toutes les lectures logiques, reads celles qui ont dû aller sur disque
+        reads = status['Innodb_buffer_pool_reads']
+        return {'hits': status['Innodb_buffer_pool_read_requests'] - reads, 'misses': reads}
+
     def close(self):
         self.cursor.close()
         self.conn.close()
\ No newline at end of file
@@ -0,0 +1,230 @@
+from itertools import islice
+from collections import Counter, defaultdict
+from .base import DatabaseAdapter
+from .catalog import catalog_for
+from .sketch import DEFAULT_MAX_DEPTH, DEFAULT_SAMPLE_SIZE, NetworkSketches
+
+
+class InMemoryAdapter(DatabaseAdapter):
+    """Moteur en processus : listes d'adjacence Python, parcours en largeur par niveau.
+
+    Les requêtes 1 et 2 acceptent `approximate=True` : au lieu du parcours exact, les achats d'un
+    échantillon bottom-k du réseau, précalculé une fois par dataset, sont extrapolés avec une marge d'erreur.
+    """
+
+    def __init__(self, approx_depth=DEFAULT_MAX_DEPTH, approx_sample_size=DEFAULT_SAMPLE_SIZE):
+        self.approx_depth = approx_depth
+        self.approx_sample_size = approx_sample_size
+        self._clear()
+
+    def _clear(self):
+        self.user_names = {}
+        self.product_names = {}
+        self.followers = defaultdict(list)
+        self.followees = defaultdict(list)
+        self.purchases = defaultdict(list)
+        self.buyers = defaultdict(set)
+        self.num_follows = 0
+        self.num_purchases = 0
+        self.catalog = None
+        self.sketches = None
+
+    def connect(self):
+        pass
+
+    def reset_and_load(self, data):
+        print("Construction des listes d'adjacence en mémoire...")
+        self._clear()
+        self.user_names = {u['id']: u['name'] for u in data['users']}
+        self.product_names = {p['id']: p['name'] for p in data['products']}
+        with self._phase("follows"):
+            for f in data['follows']:
+                self.followers[f['followee_id']].append(f['follower_id'])
+                self.followees[f['follower_id']].append(f['followee_id'])
+        with self._phase("purchases"):
+            for p in data['purchases']:
+                self.purchases[p['user_id']].append(p['product_id'])
+                self.buyers[p['product_id']].add(p['user_id'])
+        self.num_follows = len(data['follows'])
+        self.num_purchases = len(data['purchases'])
+        self.catalog = catalog_for(data)
+        print("Chargement terminé")
+
+    def _network_levels(self, user_id, depth):
+        """Followers distincts atteints à chaque niveau 1..depth (parcours exact)"""
+        indexed = self.reach_index.network(user_id, depth) if self.reach_index is not None else None
+        if indexed is not None:
+            for level in indexed:
+                yield set(level)
+            return
+        visited = set()
+        current = {user_id}
+        for _ in range(depth):
+            nxt = set()
+            for u in current:
+                nxt.update(self.followers.get(u, ()))
+            nxt -= visited
+            if not nxt:
+                return
+            visited |= nxt
+            current = nxt
+            yield nxt
+
+    def build_sketches(self):
+        self.sketches = NetworkSketches(self.approx_depth, self.approx_sample_size).build(self.followers)
+        return self.sketches
+
+    def _approx_sample(self, user_id, depth):
+        if self.sketches is None:
+            self.build_sketches()
+        if not self.sketches.covers(depth):
+            raise ValueError(f"Mode approché limité à la profondeur {self.sketches.max_depth}")
+        return self.sketches.sample(user_id, depth)
+
+    def _approx_row(self, hits, size, exact):
+        count, margin = self.sketches.estimate(hits, size, exact)
+        return {'buyers_count': count, 'error_margin': margin}
+
+    def _product_rows(self, counts):
+        rows = [{'id': pid, 'name': self.product_names.get(pid), 'buyers_count': cnt} for pid, cnt in counts.items()]
+        rows.sort(key=lambda r: (-r['buyers_count'], r['id']))
+        return rows
+
+    def query_1_products_by_followers(self, user_id, depth, approximate=False):
+        if approximate:
+            # Seuls les produits achetés par au moins un follower échantillonné apparaissent
+            members, size, exact = self._approx_sample(user_id, depth)
+            hits = Counter()
+            for follower in members:
+                hits.update(self.purchases.get(follower, ()))
+            rows = [{'id': pid, 'name': self.product_names.get(pid), **self._approx_row(n, size, exact)}
+                    for pid, n in hits.items()]
+            rows.sort(key=lambda r: (-r['buyers_count'], r['id']))
+            return rows
+
+        counts = Counter()
+        for level in self._network_levels(user_id, depth):
+            for follower in level:
+                counts.update(self.purchases.get(follower, ()))
+        return self._product_rows(counts)
+
+    def query_1_top_products(self, user_id, depth, limit, after=None):
+        rows = self.query_1_products_by_followers(user_id, depth)
+        if after is not None:
+            last_count, last_id = after
+            rows = [r for r in rows if (-r['buyers_count'], r['id']) > (-last_count, last_id)]
+        return rows[:limit]
+
+    def iter_query_1_products_by_followers(self, user_id, depth, batch_size=1000):
+        yield from self.query_1_products_by_followers(user_id, depth)
+
+    def query_2_specific_product_influence(self, user_id, product_id, depth, approximate=False):
+        buyers = self.buyers.get(product_id, set())
+        if approximate:
+            members, size, exact = self._approx_sample(user_id, depth)
+            return [self._approx_row(sum(1 for f in members if f in buyers), size, exact)]
+
+        count = sum(len(level & buyers) for level in self._network_levels(user_id, depth))
+        return [{'buyers_count': count}]
+
+    def _multi_source_reach(self, user_ids, depth):
+        """Parcours multi-sources partagé : chaque follower porte un masque de bits des sources qui l'atteignent"""
+        reached = defaultdict(int)
+        frontier = {}
+        for bit, user_id in enumerate(user_ids):
+            frontier[user_id] = frontier.get(user_id, 0) | (1 << bit)
+        for _ in range(depth):
+            nxt = defaultdict(int)
+            for u, mask in frontier.items():
+                for f in self.followers.get(u, ()):
+                    nxt[f] |= mask
+            frontier = {}
+            for f, mask in nxt.items():
+                new = mask & ~reached[f]
+                if new:
+                    reached[f] |= new
+                    frontier[f] = new
+            if not frontier:
+                break
+        return reached
+
+    @staticmethod
+    def _bits(mask):
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def query_1_batch(self, user_ids, depth):
+        user_ids = list(dict.fromkeys(user_ids))
+        counts = [Counter() for _ in user_ids]
+        for follower, mask in self._multi_source_reach(user_ids, depth).items():
+            products = self.purchases.get(follower)
+            if products:
+                for bit in self._bits(mask):
+                    counts[bit].update(products)
+        return {user_id: self._product_rows(counts[bit]) for bit, user_id in enumerate(user_ids)}
+
+    def query_2_batch(self, user_ids, product_ids, depth):
+        user_ids = list(dict.fromkeys(user_ids))
+        product_ids = list(dict.fromkeys(product_ids))
+        results = {user_id: {product_id: 0 for product_id in product_ids} for user_id in user_ids}
+        reached = self._multi_source_reach(user_ids, depth)
+        for product_id in product_ids:
+            for buyer in self.buyers.get(product_id, ()):
+                for bit in self._bits(reached.get(buyer, 0)):
+                    results[user_ids[bit]][product_id] += 1
+        return results
+
+    def _viral_levels(self, product_id, level):
+        """Acheteurs organiques (niveau 0) puis acheteurs atteints à chaque niveau parmi les followers"""
+        buyers = self.buyers.get(product_id, set())
+        organic = {u for u in buyers if not any(f in buyers for f in self.followees.get(u, ()))}
+        yield organic
+        visited = set(organic)
+        current = organic
+        for _ in range(level):
+            nxt = set()
+            for u in current:
+                nxt.update(f for f in self.followers.get(u, ()) if f in buyers)
+            nxt -= visited
+            visited |= nxt
+            current = nxt
+            yield nxt
+
+    def query_3_viral_product_disk(self, product_id, level):
+        levels = list(self._viral_levels(product_id, level))
+        if level == 0:
+            return [{'viral_buyers': len(levels[0])}]
+        return [{'viral_buyers': sum(len(s) for s in levels[1:])}]
+
+    def query_4_viral_product_circle(self, product_id, level):
+        levels = list(self._viral_levels(product_id, level))
+        return [{'viral_buyers': len(levels[-1])}]
+
+    def iter_entity(self, entity, chunk_size):
+        rows = {
+            'users': lambda: iter(self.user_names.items()),
+            'products': lambda: iter(self.product_names.items()),
+            'follows': lambda: ((f, u) for u, fs in self.followers.items() for f in fs),
+            'purchases': lambda: ((u, p) for u, ps in self.purchases.items() for p in ps)
+        }[entity]()
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def read_catalog(self):
+        return self.catalog
+
+    def get_stats(self, verify=False):
+        return {
+            'users': len(self.user_names),
+            'products': len(self.product_names),
+            'follows': self.num_follows,
+            'purchases': self.num_purchases
+        }
+
+    def close(self):
+        self._clear()
@@ -1,14 +1,28 @@
+from itertools import islice
 from neo4j import GraphDatabase
 from .base import DatabaseAdapter
+from .cache import container_available, restart_container
+from .catalog import catalog_for
 from tqdm import tqdm
 
 NEO4J_URI = "bolt://localhost:7687"
 NEO4J_AUTH = ("neo4j", "password")
+NEO4J_CONTAINER = 'tp_neo4j'
 
 BATCH_SIZE = 10000
 
+EXPORT_LABELS = {'users': 'User', 'products': 'Product'}
+EXPORT_RELATIONS = {'follows': 'FOLLOWS]->(b:User', 'purchases': 'BOUGHT]->(b:Product'}
+
 
 class Neo4jAdapter(DatabaseAdapter):
+    def __init__(self):
+        self.driver = None
+        # Index dont les followers sont matérialisés en relations IN_NETWORK_OF
+        self._reach_rels_for = None
+        # Compteurs du page cache cumulés sur les requêtes profilées (cf. _run)
+        self.page_cache = {'hits': 0, 'misses': 0}
+
     def connect(self):
         self.driver = GraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH)
 
@@ -17,73 +31,220 @@ class Neo4jAdapter(DatabaseAdapter):
             print("Suppression des données existantes...")
             session.run("MATCH ()-[r]->() DELETE r")
             session.run("MATCH (n) DELETE n")
+            self._reach_rels_for = None
 
             print("Création des index...")
             session.execute_write(lambda tx: tx.run("CREATE INDEX IF NOT EXISTS FOR (u:User) ON (u.id)"))
             session.execute_write(lambda tx: tx.run("CREATE INDEX IF NOT EXISTS FOR (p:Product) ON (p.id)"))
 
             print("Chargement des utilisateurs...")
-            users_data = [{'id': u['id'], 'name': u['name']} for u in data['users']]
-            for i in tqdm(range(0, len(users_data), BATCH_SIZE), desc="Users", unit="batch"):
-                batch = users_data[i:i + BATCH_SIZE]
-                session.execute_write(lambda tx, b=batch: tx.run("""
-                UNWIND $batch AS row
-                CREATE (:User {id: row.id, name: row.name})
-            """, batch=b))
+            with self._phase("users"):
+                users_data = [{'id': u['id'], 'name': u['name']} for u in data['users']]
+                for i in tqdm(range(0, len(users_data), BATCH_SIZE), desc="Users", unit="batch"):
+                    batch = users_data[i:i + BATCH_SIZE]
+                    session.execute_write(lambda tx, b=batch: tx.run("""
+                    UNWIND $batch AS row
+                    CREATE (:User {id: row.id, name: row.name})
+                """, batch=b))
 
             print("Chargement des produits...")
-            products_data = [{'id': p['id'], 'name': p['name']} for p in data['products']]
-            for i in tqdm(range(0, len(products_data), BATCH_SIZE), desc="Products", unit="batch"):
-                batch = products_data[i:i + BATCH_SIZE]
-                session.execute_write(lambda tx, b=batch: tx.run("""
-                UNWIND $batch AS row
-                CREATE (:Product {id: row.id, name: row.name})
-            """, batch=b))
+            with self._phase("products"):
+                products_data = [{'id': p['id'], 'name': p['name']} for p in data['products']]
+                for i in tqdm(range(0, len(products_data), BATCH_SIZE), desc="Products", unit="batch"):
+                    batch = products_data[i:i + BATCH_SIZE]
+                    session.execute_write(lambda tx, b=batch: tx.run("""
+                    UNWIND $batch AS row
+                    CREATE (:Product {id: row.id, name: row.name})
+                """, batch=b))
 
             print("Chargement des relations de suivi...")
-            follows_data = [{'follower': f['follower_id'], 'followee': f['followee_id']} for f in data['follows']]
-            for i in tqdm(range(0, len(follows_data), BATCH_SIZE), desc="Follows", unit="batch"):
-                batch = follows_data[i:i + BATCH_SIZE]
-                session.execute_write(lambda tx, b=batch: tx.run("""
-                UNWIND $batch AS row
-                MERGE (a:User {id: row.follower})
-                MERGE (b:User {id: row.followee})
-                CREATE (a)-[:FOLLOWS]->(b)
-            """, batch=b))
+            with self._phase("follows"):
+                follows_data = [{'follower': f['follower_id'], 'followee': f['followee_id']} for f in data['follows']]
+                for i in tqdm(range(0, len(follows_data), BATCH_SIZE), desc="Follows", unit="batch"):
+                    batch = follows_data[i:i + BATCH_SIZE]
+                    session.execute_write(lambda tx, b=batch: tx.run("""
+                    UNWIND $batch AS row
+                    MERGE (a:User {id: row.follower})
+                    MERGE (b:User {id: row.followee})
+                    CREATE (a)-[:FOLLOWS]->(b)
+                """, batch=b))
 
             print("Chargement des achats...")
-            purchases_data = [{'uid': p['user_id'], 'pid': p['product_id']} for p in data['purchases']]
-            for i in tqdm(range(0, len(purchases_data), BATCH_SIZE), desc="Purchases", unit="batch"):
-                batch = purchases_data[i:i + BATCH_SIZE]
-                session.execute_write(lambda tx, b=batch: tx.run("""
-                UNWIND $batch AS row
-                MERGE (u:User {id: row.uid})
-                MERGE (p:Product {id: row.pid})
-                CREATE (u)-[:BOUGHT]->(p)
-            """, batch=b))
+            with self._phase("purchases"):
+                purchases_data = [{'uid': p['user_id'], 'pid': p['product_id']} for p in data['purchases']]
+                for i in tqdm(range(0, len(purchases_data), BATCH_SIZE), desc="Purchases", unit="batch"):
+                    batch = purchases_data[i:i + BATCH_SIZE]
+                    session.execute_write(lambda tx, b=batch: tx.run("""
+                    UNWIND $batch AS row
+                    MERGE (u:User {id: row.uid})
+                    MERGE (p:Product {id: row.pid})
+                    CREATE (u)-[:BOUGHT]->(p)
+                """, batch=b))
 
+            print("Écriture du catalogue du dataset...")
+            session.execute_write(lambda tx: tx.run("CREATE (c:DatasetCatalog) SET c = $catalog", catalog=catalog_for(data)))
             print("Chargement terminé")
 
-    def query_1_products_by_followers(self, user_id, depth):
-        query = f"""
-        MATCH (influencer:User {{id: $user_id}})<-[:FOLLOWS*1..{depth}]-(follower:User)-[:BOUGHT]->(p:Product)
-        RETURN p.name as name, count(DISTINCT follower) as buyers_count
-        ORDER BY buyers_count DESC
+    def read_catalog(self):
+        with self.driver.session() as session:
+            record = session.run("MATCH (c:DatasetCatalog) RETURN properties(c) as catalog LIMIT 1").single()
+        return record['catalog'] if record else None
+
+    def set_reach_index(self, index):
+        """Matérialise l'index une fois pour toutes en relations (follower)-[:IN_NETWORK_OF {level}]->(influenceur)"""
+        self.reach_index = index
+        self._reach_rels_for = None
+        if index is None or self.driver is None:
+            return
+        with self.driver.session() as session:
+            session.run("""
+                MATCH ()-[r:IN_NETWORK_OF]->()
+                CALL { WITH r DELETE r } IN TRANSACTIONS OF 10000 ROWS
+            """).consume()
+            rows = ({'user_id': u, 'level': level, 'follower_id': f} for u, level, f in index.rows())
+            while batch := list(islice(rows, BATCH_SIZE)):
+                session.execute_write(lambda tx, b=batch: tx.run("""
+                    UNWIND $batch AS row
+                    MATCH (influencer:User {id: row.user_id}), (follower:User {id: row.follower_id})
+                    CREATE (follower)-[:IN_NETWORK_OF {level: row.level}]->(influencer)
+                """, batch=b))
+        self._reach_rels_for = index
+
+    def _count_page_cache(self, plan):
+        self.page_cache['hits'] += plan.get('pageCacheHits', 0)
+        self.page_cache['misses'] += plan.get('pageCacheMisses', 0)
+        for child in plan.get('children', []):
+            self._count_page_cache(child)
+
+    def _run(self, session, query, **params):
+        """Exécute une requête sous PROFILE et cumule les accès au page cache de son plan"""
+        result = session.run("PROFILE " + query, **params)
+        rows = result.data()
+        self._count_page_cache(result.consume().profile or {})
+        return rows
+
+    def _network_match(self, user_id, depth, product=""):
+        index = self.reach_index
+        if index is not None and index is self._reach_rels_for and index.covers(user_id, depth):
+            match = f"""
+            MATCH (influencer:User {{id: $user_id}})<-[r:IN_NETWORK_OF]-(follower:User)
+            WHERE r.level <= $depth
+            MATCH (follower)-[:BOUGHT]->(p:Product{product})
+            """
+            return match, {'user_id': user_id, 'depth': depth}
+        match = f"MATCH (influencer:User {{id: $user_id}})<-[:FOLLOWS*1..{depth}]-(follower:User)-[:BOUGHT]->(p:Product{product})"
+        return match, {'user_id': user_id}
+
+    def _query_1_cypher(self, match, paginated=False):
+        cursor = """
+        WHERE $after_count IS NULL
+           OR buyers_count < $after_count
+           OR (buyers_count = $after_count AND p.id > $after_id)
+        """ if paginated else ""
+        limit = "LIMIT $limit" if paginated else ""
+        return f"""
+        {match}
+        WITH p, count(DISTINCT follower) as buyers_count
+        {cursor}
+        RETURN p.id as id, p.name as name, buyers_count
+        ORDER BY buyers_count DESC, id ASC
+        {limit}
         """
+
+    def query_1_products_by_followers(self, user_id, depth):
+        match, params = self._network_match(user_id, depth)
+        with self.driver.session() as session:
+            return self._run(session, self._query_1_cypher(match), **params)
+
+    def query_1_top_products(self, user_id, depth, limit, after=None):
+        after_count, after_id = after if after is not None else (None, None)
+        match, params = self._network_match(user_id, depth)
         with self.driver.session() as session:
-            return session.run(query, user_id=user_id).data()
+            return self._run(
+                session,
+                self._query_1_cypher(match, paginated=True),
+                limit=limit,
+                after_count=after_count,
+                after_id=after_id,
+                **params
+            )
+
+    def iter_query_1_products_by_followers(self, user_id, depth, batch_size=1000):
+        match, params = self._network_match(user_id, depth)
+        with self.driver.session(fetch_size=batch_size) as session:
+            result = session.run("PROFILE " + self._query_1_cypher(match), **params)
+            for record in result:
+                yield record.data()
+            self._count_page_cache(result.consume().profile or {})
 
     def query_2_specific_product_influence(self, user_id, product_id, depth):
+        match, params = self._network_match(user_id, depth, " {id: $product_id}")
         query = f"""
-        MATCH (influencer:User {{id: $user_id}})<-[:FOLLOWS*1..{depth}]-(follower:User)-[:BOUGHT]->(p:Product {{id: $product_id}})
+        {match}
         RETURN count(DISTINCT follower) as buyers_count
         """
         with self.driver.session() as session:
-            result = session.run(query, user_id=user_id, product_id=product_id).data()
+            result = self._run(session, query, product_id=product_id, **params)
             if not result:
                 return [{'buyers_count': 0}]
             return result
 
+    def _batch_network_match(self, depth):
+        """Followers à 1..depth niveaux de chaque source du lot, en lignes DISTINCT (source_id, follower).
+
+        L'expansion est partagée entre les sources : à chaque niveau, un nœud n'apparaît qu'une fois
+        avec la liste des sources qui l'atteignent ; les lignes des niveaux précédents sont reportées.
+        """
+        levels = "".join(f"""
+        UNWIND [0, 1] AS step
+        OPTIONAL MATCH (node)<-[:FOLLOWS]-(follower:User) WHERE step = 1 AND lvl = {level - 1}
+        WITH CASE step WHEN 0 THEN node ELSE follower END AS node,
+             CASE step WHEN 0 THEN lvl ELSE {level} END AS lvl, sources
+        WHERE node IS NOT NULL
+        UNWIND sources AS source_id
+        WITH node, lvl, collect(DISTINCT source_id) AS sources
+        """ for level in range(1, depth + 1))
+        return f"""
+        UNWIND $user_ids AS source_id
+        MATCH (node:User {{id: source_id}})
+        WITH node, 0 AS lvl, collect(source_id) AS sources
+        {levels}
+        WITH node, sources WHERE lvl > 0
+        UNWIND sources AS source_id
+        WITH DISTINCT source_id, node AS follower
+        """
+
+    def query_1_batch(self, user_ids, depth):
+        user_ids = list(dict.fromkeys(user_ids))
+        results = {user_id: [] for user_id in user_ids}
+        query = f"""
+        {self._batch_network_match(depth)}
+        MATCH (follower)-[:BOUGHT]->(p:Product)
+        WITH source_id, p, count(follower) as buyers_count
+        RETURN source_id, p.id as id, p.name as name, buyers_count
+        ORDER BY source_id, buyers_count DESC, id ASC
+        """
+        with self.driver.session() as session:
+            for row in self._run(session, query, user_ids=user_ids):
+                source_id = row.pop('source_id')
+                results[source_id].append(row)
+        return results
+
+    def query_2_batch(self, user_ids, product_ids, depth):
+        user_ids = list(dict.fromkeys(user_ids))
+        product_ids = list(dict.fromkeys(product_ids))
+        results = {user_id: {product_id: 0 for product_id in product_ids} for user_id in user_ids}
+        query = f"""
+        {self._batch_network_match(depth)}
+        MATCH (follower)-[:BOUGHT]->(p:Product)
+        WHERE p.id IN $product_ids
+        RETURN source_id, p.id as product_id, count(follower) as buyers_count
+        """
+        with self.driver.session() as session:
+            for row in self._run(session, query, user_ids=user_ids, product_ids=product_ids):
+                results[row['source_id']][row['product_id']] = row['buyers_count']
+        return results
+
     def query_3_viral_product_disk(self, product_id, level):
         if level == 0:
             query = """
@@ -92,7 +253,7 @@ class Neo4jAdapter(DatabaseAdapter):
             RETURN count(DISTINCT u) as viral_buyers
             """
             with self.driver.session() as session:
-                result = session.run(query, product_id=product_id).data()
+                result = self._run(session, query, product_id=product_id)
                 return result if result else [{'viral_buyers': 0}]
 
         organic_query = """
@@ -108,7 +269,7 @@ class Neo4jAdapter(DatabaseAdapter):
         RETURN collect(DISTINCT follower.id) as ids
         """
         with self.driver.session() as session:
-            organic_ids = session.run(organic_query, product_id=product_id).single()['ids']
+            organic_ids = self._run(session, organic_query, product_id=product_id)[0]['ids']
             visited = set(organic_ids)
             current = set(organic_ids)
             disk_buyers = set()
@@ -116,12 +277,13 @@ class Neo4jAdapter(DatabaseAdapter):
             for _ in range(level):
                 if not current:
                     break
-                new_ids = session.run(
+                new_ids = self._run(
+                    session,
                     hop_query,
                     current_ids=list(current),
                     visited_ids=list(visited),
                     product_id=product_id
-                ).single()['ids']
+                )[0]['ids']
                 new_set = set(new_ids) - visited
                 visited |= new_set
                 current = new_set
@@ -137,7 +299,7 @@ class Neo4jAdapter(DatabaseAdapter):
             RETURN count(DISTINCT u) as viral_buyers
             """
             with self.driver.session() as session:
-                result = session.run(query, product_id=product_id).data()
+                result = self._run(session, query, product_id=product_id)
                 return result if result else [{'viral_buyers': 0}]
 
         organic_query = """
@@ -153,19 +315,20 @@ class Neo4jAdapter(DatabaseAdapter):
         RETURN collect(DISTINCT follower.id) as ids
         """
         with self.driver.session() as session:
-            organic_ids = session.run(organic_query, product_id=product_id).single()['ids']
+            organic_ids = self._run(session, organic_query, product_id=product_id)[0]['ids']
             visited = set(organic_ids)
             current = set(organic_ids)
 
             for _ in range(level):
                 if not current:
                     return [{'viral_buyers': 0}]
-                new_ids = session.run(
+                new_ids = self._run(
+                    session,
                     hop_query,
                     current_ids=list(current),
                     visited_ids=list(visited),
                     product_id=product_id
-                ).single()['ids']
+                )[0]['ids']
                 new_set = set(new_ids) - visited
                 visited |= new_set
                 current = new_set
@@ -173,8 +336,43 @@ class Neo4jAdapter(DatabaseAdapter):
             return [{'viral_buyers': len(current)}]
 
 
-    def get_stats(self):
+    def _iter_id_pages(self, session, label, chunk_size):
+        """Pagination par clé (id croissant, via l'index) sur les nœuds d'un label"""
+        after = -2 ** 31
+        while True:
+            rows = session.run(f"""
+            MATCH (n:{label}) WHERE n.id > $after
+            RETURN n.id AS id, n.name AS name
+            ORDER BY n.id
+            LIMIT $limit
+            """, after=after, limit=chunk_size).values()
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    def iter_entity(self, entity, chunk_size):
+        with self.driver.session() as session:
+            if entity in EXPORT_LABELS:
+                yield from self._iter_id_pages(session, EXPORT_LABELS[entity], chunk_size)
+                return
+            # Relations exportées par page d'utilisateurs sources, relues en flux par blocs d'au plus chunk_size
+            for users in self._iter_id_pages(session, 'User', chunk_size):
+                result = session.run(f"""
+                UNWIND $ids AS id
+                MATCH (a:User {{id: id}})-[:{EXPORT_RELATIONS[entity]})
+                RETURN a.id, b.id
+                """, ids=[u[0] for u in users])
+                rows = (record.values() for record in result)
+                while page := list(islice(rows, chunk_size)):
+                    yield page
+
+    def get_stats(self, verify=False):
         try:
+            if not verify:
+                catalog = self.read_catalog()
+                if catalog:
+                    return catalog
             with self.driver.session() as session:
                 users = session.run("MATCH (u:User) RETURN count(u) as cnt").single()['cnt']
                 products = session.run("MATCH (p:Product) RETURN count(p) as cnt").single()['cnt']
@@ -184,6 +382,28 @@ class Neo4jAdapter(DatabaseAdapter):
         except Exception:
             return None
 
+    def warm_up(self):
+        # Lire l'id des deux extrémités force le chargement des nœuds, relations et propriétés dans le page cache
+        with self.driver.session() as session:
+            session.run("MATCH (u:User) WHERE u.id >= 0 RETURN count(u)").consume()
+            session.run("MATCH (p:Product) WHERE p.id >= 0 RETURN count(p)").consume()
+            session.run("MATCH (a:User)-[:FOLLOWS]->(b:User) RETURN sum(a.id + b.id)").consume()
+            session.run("MATCH (u:User)-[:BOUGHT]->(p:Product) RETURN sum(u.id + p.id)").consume()
+
+    def _reconnect(self):
+        self.connect()
+        self.driver.verify_connectivity()
+
+    def cold_start(self):
+        if not container_available(NEO4J_CONTAINER):
+            return False
+        self.close()
+        restart_container(NEO4J_CONTAINER, self._reconnect)
+        return True
+
+    def cache_counters(self):
+        return dict(self.page_cache)
+
     def close(self):
         self.driver.close()
 
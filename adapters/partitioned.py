@@ -0,0 +1,333 @@
+import multiprocessing as mp
+import os
+import time
+from array import array
+from collections import Counter, defaultdict
+from multiprocessing import shared_memory
+from .base import DatabaseAdapter
+from .catalog import catalog_for
+from .profiling import current_rss_mb
+
+RELATIONS = ('followers_offsets', 'followers', 'purchases_offsets', 'purchases')
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _build_csr(pairs, num_workers, num_rows):
+    """Listes d'adjacence CSR par partition (propriétaire = clé % num_workers, ligne locale = clé // num_workers)"""
+    offsets = [array('i', bytes(4 * (num_rows + 1))) for _ in range(num_workers)]
+    for key, _ in pairs():
+        offsets[key % num_workers][key // num_workers + 1] += 1
+    for off in offsets:
+        for i in range(1, len(off)):
+            off[i] += off[i - 1]
+
+    adjacency = [array('i', bytes(4 * off[-1])) for off in offsets]
+    positions = [array('i', off) for off in offsets]
+    for key, value in pairs():
+        w, row = key % num_workers, key // num_workers
+        adjacency[w][positions[w][row]] = value
+        positions[w][row] += 1
+    return offsets, adjacency
+
+
+class _Partition:
+    """État d'un worker : sa tranche des adjacences (mémoire partagée) et sa part des followers visités"""
+
+    def __init__(self, index, num_workers, views, inboxes):
+        self.index = index
+        self.num_workers = num_workers
+        self.views = views
+        # File de réception de chaque worker, la sienne comprise
+        self.inboxes = inboxes
+        self.visited = {}
+        self.frontier = {}
+        self.buyers = set()
+        self.non_organic = set()
+
+    def _row(self, relation, uid):
+        off = self.views[relation + '_offsets']
+        row = uid // self.num_workers
+        if row + 1 >= len(off):
+            return ()
+        return self.views[relation][off[row]:off[row + 1]]
+
+    def reset(self):
+        self.visited = {}
+        self.frontier = {}
+
+    def seed(self, frontier):
+        self.frontier = frontier
+
+    def expand(self):
+        buckets = [defaultdict(int) for _ in range(self.num_workers)]
+        for uid, mask in self.frontier.items():
+            for follower in self._row('followers', uid):
+                buckets[follower % self.num_workers][follower] |= mask
+        return [dict(b) for b in buckets]
+
+    def exchange(self, cmd, *extra):
+        """Un niveau de parcours : étend la frontière et envoie chaque bloc directement au worker propriétaire"""
+        buckets = self.expand()
+        for w, inbox in enumerate(self.inboxes):
+            if w != self.index:
+                inbox.put(buckets[w])
+        inbox = self.inboxes[self.index]
+        candidates = [buckets[self.index]] + [inbox.get() for _ in range(self.num_workers - 1)]
+        return getattr(self, cmd)(candidates, *extra)
+
+    def visit(self, candidates, buyers_only=False):
+        frontier = {}
+        for chunk in candidates:
+            for uid, mask in chunk.items():
+                if buyers_only and uid not in self.buyers:
+                    continue
+                new = mask & ~self.visited.get(uid, 0)
+                if new:
+                    self.visited[uid] = self.visited.get(uid, 0) | new
+                    # Plusieurs blocs peuvent apporter des sources différentes pour le même utilisateur
+                    frontier[uid] = frontier.get(uid, 0) | new
+        self.frontier = frontier
+        return len(frontier)
+
+    def count_products(self, num_sources):
+        counts = [Counter() for _ in range(num_sources)]
+        for uid, mask in self.visited.items():
+            products = self._row('purchases', uid)
+            if len(products):
+                for bit in _bits(mask):
+                    counts[bit].update(products)
+        return counts
+
+    def count_buyers(self, product_ids):
+        wanted = set(product_ids)
+        counts = Counter()
+        for uid, mask in self.visited.items():
+            for pid in self._row('purchases', uid):
+                if pid in wanted:
+                    for bit in _bits(mask):
+                        counts[bit, pid] += 1
+        return counts
+
+    def select_product(self, product_id):
+        off = self.views['purchases_offsets']
+        adj = self.views['purchases']
+        self.buyers = {row * self.num_workers + self.index
+                       for row in range(len(off) - 1)
+                       if product_id in adj[off[row]:off[row + 1]]}
+        self.frontier = {uid: 1 for uid in self.buyers}
+
+    def usage(self):
+        # La RSS inclut les pages de mémoire partagée lues par ce worker
+        return {'cpu': time.process_time(), 'rss_mb': current_rss_mb() or 0}
+
+    def mark_non_organic(self, candidates):
+        # Un acheteur suivant un autre acheteur du produit n'est pas organique
+        self.non_organic = {uid for chunk in candidates for uid in chunk if uid in self.buyers}
+
+    def seed_organic(self):
+        self.visited = {uid: 1 for uid in self.buyers - self.non_organic}
+        self.frontier = dict(self.visited)
+        return len(self.visited)
+
+
+def _worker(conn, index, num_workers, shm_specs, inboxes):
+    shms, buffers, views = [], [], {}
+    for relation, (name, length) in shm_specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        buf = shm.buf[:4 * length]
+        shms.append(shm)
+        buffers.append(buf)
+        views[relation] = buf.cast('i')
+    partition = _Partition(index, num_workers, views, inboxes)
+    try:
+        while True:
+            cmd, args = conn.recv()
+            if cmd == 'stop':
+                break
+            conn.send(getattr(partition, cmd)(*args))
+    finally:
+        for view in views.values():
+            view.release()
+        for buf in buffers:
+            buf.release()
+        for shm in shms:
+            shm.close()
+
+
+class PartitionedAdapter(DatabaseAdapter):
+    """Moteur en processus multi-cœurs : utilisateurs partitionnés par hachage (id % workers).
+
+    Chaque worker possède en mémoire partagée sa tranche des adjacences followers et purchases
+    ainsi que sa part de l'ensemble visité ; à chaque niveau du parcours en largeur, les workers
+    s'envoient directement les blocs de frontière, le coordinateur ne fait que cadencer les niveaux.
+    """
+
+    def __init__(self, workers=None):
+        self.num_workers = workers or os.cpu_count()
+        self.processes = []
+        self.conns = []
+        self.shms = []
+        self.inboxes = []
+        self.product_names = {}
+        self.stats = {'users': 0, 'products': 0, 'follows': 0, 'purchases': 0}
+        self.catalog = None
+        # Incrémenté à chaque démarrage des workers, pour ne pas comparer les relevés de deux jeux de processus
+        self.generation = 0
+
+    def connect(self):
+        pass
+
+    def reset_and_load(self, data):
+        self.close()
+        n = self.num_workers
+        print(f"Partitionnement des adjacences sur {n} workers...")
+        max_uid = max([u['id'] for u in data['users']], default=0)
+        num_rows = max_uid // n + 1
+        with self._phase("follows"):
+            followers_offsets, followers = _build_csr(
+                lambda: ((f['followee_id'], f['follower_id']) for f in data['follows']), n, num_rows)
+        with self._phase("purchases"):
+            purchases_offsets, purchases = _build_csr(
+                lambda: ((p['user_id'], p['product_id']) for p in data['purchases']), n, num_rows)
+
+        print("Copie en mémoire partagée et démarrage des workers...")
+        self.generation += 1
+        arrays = dict(zip(RELATIONS, (followers_offsets, followers, purchases_offsets, purchases)))
+        # Une file par worker (et non un tube par paire) : O(n) descripteurs, envois non bloquants
+        self.inboxes = [mp.Queue() for _ in range(n)]
+        for index in range(n):
+            specs = {}
+            for relation in RELATIONS:
+                arr = arrays[relation][index]
+                shm = shared_memory.SharedMemory(create=True, size=max(4 * len(arr), 4))
+                shm.buf[:4 * len(arr)] = arr.tobytes()
+                self.shms.append(shm)
+                specs[relation] = (shm.name, len(arr))
+            parent_conn, child_conn = mp.Pipe()
+            process = mp.Process(target=_worker, args=(child_conn, index, n, specs, self.inboxes), daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.conns.append(parent_conn)
+
+        self.product_names = {p['id']: p['name'] for p in data['products']}
+        self.stats = {
+            'users': len(data['users']),
+            'products': len(data['products']),
+            'follows': len(data['follows']),
+            'purchases': len(data['purchases'])
+        }
+        self.catalog = catalog_for(data)
+        print("Chargement terminé")
+
+    def _broadcast(self, cmd, *args):
+        for conn in self.conns:
+            conn.send((cmd, args))
+        return [conn.recv() for conn in self.conns]
+
+    def _scatter(self, cmd, per_worker_args):
+        for conn, args in zip(self.conns, per_worker_args):
+            conn.send((cmd, args))
+        return [conn.recv() for conn in self.conns]
+
+    def _exchange(self, cmd, *extra):
+        return self._broadcast('exchange', cmd, *extra)
+
+    def _multi_source_bfs(self, user_ids, depth):
+        self._broadcast('reset')
+        seeds = [defaultdict(int) for _ in range(self.num_workers)]
+        for bit, user_id in enumerate(user_ids):
+            seeds[user_id % self.num_workers][user_id] |= 1 << bit
+        self._scatter('seed', [(dict(s),) for s in seeds])
+        for _ in range(depth):
+            if not sum(self._exchange('visit')):
+                break
+
+    def _product_rows(self, counts):
+        rows = [{'id': pid, 'name': self.product_names.get(pid), 'buyers_count': cnt} for pid, cnt in counts.items()]
+        rows.sort(key=lambda r: (-r['buyers_count'], r['id']))
+        return rows
+
+    def query_1_batch(self, user_ids, depth):
+        user_ids = list(dict.fromkeys(user_ids))
+        self._multi_source_bfs(user_ids, depth)
+        totals = [Counter() for _ in user_ids]
+        for partial in self._broadcast('count_products', len(user_ids)):
+            for bit, counts in enumerate(partial):
+                totals[bit].update(counts)
+        return {user_id: self._product_rows(totals[bit]) for bit, user_id in enumerate(user_ids)}
+
+    def query_2_batch(self, user_ids, product_ids, depth):
+        user_ids = list(dict.fromkeys(user_ids))
+        product_ids = list(dict.fromkeys(product_ids))
+        results = {user_id: {product_id: 0 for product_id in product_ids} for user_id in user_ids}
+        self._multi_source_bfs(user_ids, depth)
+        for partial in self._broadcast('count_buyers', product_ids):
+            for (bit, product_id), count in partial.items():
+                results[user_ids[bit]][product_id] += count
+        return results
+
+    def query_1_products_by_followers(self, user_id, depth):
+        return self.query_1_batch([user_id], depth)[user_id]
+
+    def query_1_top_products(self, user_id, depth, limit, after=None):
+        rows = self.query_1_products_by_followers(user_id, depth)
+        if after is not None:
+            last_count, last_id = after
+            rows = [r for r in rows if (-r['buyers_count'], r['id']) > (-last_count, last_id)]
+        return rows[:limit]
+
+    def iter_query_1_products_by_followers(self, user_id, depth, batch_size=1000):
+        yield from self.query_1_products_by_followers(user_id, depth)
+
+    def query_2_specific_product_influence(self, user_id, product_id, depth):
+        return [{'buyers_count': self.query_2_batch([user_id], [product_id], depth)[user_id][product_id]}]
+
+    def _viral_level_sizes(self, product_id, level):
+        """Nombre d'acheteurs organiques (niveau 0) puis nouveaux acheteurs atteints à chaque niveau"""
+        self._broadcast('reset')
+        self._broadcast('select_product', product_id)
+        self._exchange('mark_non_organic')
+        sizes = [sum(self._broadcast('seed_organic'))]
+        for _ in range(level):
+            sizes.append(sum(self._exchange('visit', True)))
+        return sizes
+
+    def query_3_viral_product_disk(self, product_id, level):
+        sizes = self._viral_level_sizes(product_id, level)
+        if level == 0:
+            return [{'viral_buyers': sizes[0]}]
+        return [{'viral_buyers': sum(sizes[1:])}]
+
+    def query_4_viral_product_circle(self, product_id, level):
+        return [{'viral_buyers': self._viral_level_sizes(product_id, level)[-1]}]
+
+    def read_catalog(self):
+        return self.catalog
+
+    def resource_usage(self):
+        if not self.conns:
+            return None
+        usages = self._broadcast('usage')
+        return {'cpu': sum(u['cpu'] for u in usages), 'rss_mb': sum(u['rss_mb'] for u in usages),
+                'generation': self.generation}
+
+    def get_stats(self, verify=False):
+        return dict(self.stats)
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(('stop', ()))
+        for process in self.processes:
+            process.join()
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+        for inbox in self.inboxes:
+            inbox.close()
+        self.processes, self.conns, self.shms, self.inboxes = [], [], [], []
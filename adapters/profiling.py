@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus depuis son démarrage (None si non disponible)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """Mémoire résidente actuelle du processus, lue dans /proc (None hors Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+class Profiler:
+    """Temps, CPU, RSS et (optionnellement) allocations Python par phase, phases imbriquées nommées a/b.
+
+    `rss_delta_mb` compare la RSS courante avant et après la phase ; `peak_rss_mb` est le pic
+    du processus depuis son démarrage. `usage` (optionnel) relève CPU et RSS des processus
+    auxiliaires d'un moteur ({'cpu', 'rss_mb', 'generation'} ou None), reportés en workers_cpu / workers_rss_mb.
+    """
+
+    def __init__(self, trace_allocations=False, top_allocations=5):
+        self.trace_allocations = trace_allocations
+        self.top_allocations = top_allocations
+        self.phases = []
+        self._stack = []
+
+    @property
+    def trace_allocations(self):
+        return self._trace_allocations
+
+    @trace_allocations.setter
+    def trace_allocations(self, enabled):
+        self._trace_allocations = enabled
+        # tracemalloc ralentit toutes les allocations tant qu'il tourne
+        if not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name, usage=None):
+        record = {'phase': '/'.join([p['phase'] for p in self._stack[-1:]] + [name])}
+        self._stack.append(record)
+        tracing = self.trace_allocations
+        if tracing:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        record['_child_py_peak'] = 0
+        rss_before = current_rss_mb()
+        usage_before = usage() if usage else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            record['rss_mb'] = current_rss_mb()
+            record['rss_delta_mb'] = record['rss_mb'] - rss_before if rss_before is not None else None
+            record['peak_rss_mb'] = peak_rss_mb()
+            usage_after = usage() if usage else None
+            if usage_after is not None:
+                # Workers (re)démarrés pendant la phase : l'ancien relevé concerne d'autres processus
+                before = usage_before
+                if before is None or before['generation'] != usage_after['generation']:
+                    before = {'cpu': 0, 'rss_mb': 0}
+                record['workers_cpu'] = usage_after['cpu'] - before['cpu']
+                record['workers_rss_mb'] = usage_after['rss_mb']
+                record['workers_rss_delta_mb'] = usage_after['rss_mb'] - before['rss_mb']
+            child_peak = record.pop('_child_py_peak')
+            if tracing:
+                py_peak = max(tracemalloc.get_traced_memory()[1], child_peak)
+                record['py_peak_mb'] = py_peak / 1024 / 1024
+                stats = tracemalloc.take_snapshot().statistics('lineno')[:self.top_allocations]
+                record['top_allocations'] = [f"{s.traceback[0].filename}:{s.traceback[0].lineno} "
+                                             f"{s.size / 1024 / 1024:.1f} Mo" for s in stats]
+            self._stack.pop()
+            if self._stack and tracing:
+                # reset_peak() de la sous-phase a effacé le pic de la phase parente
+                parent = self._stack[-1]
+                parent['_child_py_peak'] = max(parent['_child_py_peak'], py_peak)
+            self.phases.append(record)
+
+    def report(self, records=None):
+        records = self.phases if records is None else records
+        print(f"\n{'Phase':<28} {'Temps':>9} {'CPU':>9} {'RSS':>10} {'ΔRSS':>10} {'Pic RSS':>10}")
+        print("─" * 80)
+        for r in records:
+            rss = f"{r['rss_mb']:>7.0f} Mo" if r['rss_mb'] is not None else f"{'-':>10}"
+            delta = f"{r['rss_delta_mb']:>+7.0f} Mo" if r['rss_delta_mb'] is not None else f"{'-':>10}"
+            peak = f"{r['peak_rss_mb']:>7.0f} Mo" if r['peak_rss_mb'] is not None else f"{'-':>10}"
+            py_peak = f" (Python {r['py_peak_mb']:.1f} Mo)" if 'py_peak_mb' in r else ""
+            print(f"{r['phase']:<28} {r['wall']:>8.2f}s {r['cpu']:>8.2f}s {rss} {delta} {peak}{py_peak}")
+            if 'workers_cpu' in r:
+                print(f"{'  + workers':<28} {'':>9} {r['workers_cpu']:>8.2f}s {r['workers_rss_mb']:>7.0f} Mo "
+                      f"{r['workers_rss_delta_mb']:>+7.0f} Mo")
+            for line in r.get('top_allocations', []):
+                print(f"    {line}")
+
+
+@contextmanager
+def null_phase(name):
+    yield {}
@@ -0,0 +1,77 @@
+import sys
+import time
+from array import array
+from collections import defaultdict
+
+DEFAULT_TOP_USERS = 100
+DEFAULT_MAX_DEPTH = 3
+
+
+class ReachabilityIndex:
+    """Followers distincts par niveau (1..max_depth) des utilisateurs les plus suivis, en tableaux d'entiers triés"""
+
+    def __init__(self, top_users=DEFAULT_TOP_USERS, max_depth=DEFAULT_MAX_DEPTH):
+        self.top_users = top_users
+        self.max_depth = max_depth
+        self.levels = {}
+        self.build_time = None
+
+    def build(self, follows):
+        start = time.time()
+        followers = defaultdict(list)
+        for f in follows:
+            followers[f['followee_id']].append(f['follower_id'])
+
+        top = sorted(followers, key=lambda u: (-len(followers[u]), u))[:self.top_users]
+        self.levels = {}
+        for user_id in top:
+            visited = set()
+            current = {user_id}
+            user_levels = []
+            for _ in range(self.max_depth):
+                nxt = set()
+                for u in current:
+                    nxt.update(followers.get(u, ()))
+                nxt -= visited
+                visited |= nxt
+                current = nxt
+                user_levels.append(array('i', sorted(nxt)))
+            self.levels[user_id] = user_levels
+
+        self.build_time = time.time() - start
+        return self
+
+    def covers(self, user_id, depth):
+        return user_id in self.levels and depth <= self.max_depth
+
+    def network(self, user_id, depth):
+        """Niveaux 1..depth de followers de user_id, ou None si la requête n'est pas couverte par l'index"""
+        if not self.covers(user_id, depth):
+            return None
+        return self.levels[user_id][:depth]
+
+    def network_ids(self, user_id, depth):
+        levels = self.network(user_id, depth)
+        if levels is None:
+            return None
+        ids = array('i')
+        for level in levels:
+            ids.extend(level)
+        return ids
+
+    def rows(self):
+        """Tuples (user_id, niveau, follower_id) de l'index, générés à la demande"""
+        for user_id, user_levels in self.levels.items():
+            for level, followers in enumerate(user_levels, 1):
+                for follower_id in followers:
+                    yield user_id, level, follower_id
+
+    def memory_bytes(self):
+        total = sys.getsizeof(self.levels)
+        for user_levels in self.levels.values():
+            total += sys.getsizeof(user_levels)
+            total += sum(sys.getsizeof(level) for level in user_levels)
+        return total
+
+    def __len__(self):
+        return len(self.levels)
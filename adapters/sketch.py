@@ -0,0 +1,114 @@
+import math
+import time
+from array import array
+
+MASK_64 = (1 << 64) - 1
+DEFAULT_MAX_DEPTH = 4
+DEFAULT_SAMPLE_SIZE = 64
+
+_M1 = 0xBF58476D1CE4E5B9
+_M2 = 0x94D049BB133111EB
+_GOLDEN = 0x9E3779B97F4A7C15
+_M1_INV = pow(_M1, -1, 1 << 64)
+_M2_INV = pow(_M2, -1, 1 << 64)
+
+
+def hash_64(value):
+    """Hachage 64 bits (splitmix64) d'un identifiant entier ; bijectif, cf. unhash_64"""
+    z = (value + _GOLDEN) & MASK_64
+    z = ((z ^ (z >> 30)) * _M1) & MASK_64
+    z = ((z ^ (z >> 27)) * _M2) & MASK_64
+    return z ^ (z >> 31)
+
+
+def _unshift(z, shift):
+    y = z
+    for _ in range(64 // shift):
+        y = z ^ (y >> shift)
+    return y
+
+
+def unhash_64(h):
+    """Identifiant dont hash_64 vaut h"""
+    z = _unshift(h, 31)
+    z = (z * _M2_INV) & MASK_64
+    z = _unshift(z, 27)
+    z = (z * _M1_INV) & MASK_64
+    z = _unshift(z, 30)
+    return (z - _GOLDEN) & MASK_64
+
+
+class NetworkSketches:
+    """Échantillons bottom-k précalculés des followers à 1..max_depth niveaux de chaque utilisateur.
+
+    Le sketch d'un réseau garde les k plus petits hachages de ses membres : c'est un échantillon
+    uniforme de k followers distincts, fusionnable (S_d(u) = k plus petits de l'union des S_{d-1}(f)
+    et des f, pour f follower de u), dont le k-ième hachage estime la taille du réseau. Construits
+    une fois par dataset ; une requête ne regarde plus que les achats des k followers échantillonnés.
+    Un réseau de moins de k followers est gardé en entier et donne un résultat exact.
+    """
+
+    def __init__(self, max_depth=DEFAULT_MAX_DEPTH, sample_size=DEFAULT_SAMPLE_SIZE):
+        self.max_depth = max_depth
+        self.k = sample_size
+        self.levels = []
+        self.build_time = None
+
+    def build(self, followers):
+        start = time.time()
+        k = self.k
+        own = {}
+        for u, follower_list in followers.items():
+            own[u] = hash_64(u)
+            for f in follower_list:
+                if f not in own:
+                    own[f] = hash_64(f)
+
+        # with_self[f] = sketch du réseau de f au niveau précédent, f compris
+        with_self = {f: (h,) for f, h in own.items()}
+        self.levels = []
+        for _ in range(self.max_depth):
+            level = {}
+            for u, follower_list in followers.items():
+                if follower_list:
+                    merged = set().union(*[with_self[f] for f in follower_list])
+                    level[u] = array('Q', sorted(merged)[:k])
+            self.levels.append(level)
+            with_self = {f: (h,) for f, h in own.items()}
+            for u, sketch in level.items():
+                h = own[u]
+                with_self[u] = sketch if h in sketch or (len(sketch) == k and h > sketch[-1]) else \
+                    sorted((*sketch, h))[:k]
+        self.build_time = time.time() - start
+        return self
+
+    def covers(self, depth):
+        return depth <= self.max_depth
+
+    def sample(self, user_id, depth):
+        """(followers échantillonnés, taille estimée du réseau, vrai si l'échantillon est le réseau entier)"""
+        sketch = self.levels[depth - 1].get(user_id, ())
+        members = [unhash_64(h) for h in sketch]
+        if len(sketch) < self.k:
+            return members, len(sketch), True
+        # Estimateur KMV : (k - 1) / k-ième plus petit hachage normalisé
+        return members, (self.k - 1) * (MASK_64 + 1) / (sketch[-1] + 1), False
+
+    def estimate(self, hits, size, exact):
+        """Acheteurs estimés à partir de `hits` acheteurs parmi l'échantillon, et marge d'erreur à ~95 %"""
+        if exact:
+            return hits, 0
+        k = self.k
+        if hits == 0:
+            # Règle des trois : aucune occurrence dans k tirages
+            return 0, math.ceil(3 * size / k)
+        fraction = hits / k
+        estimate = fraction * size
+        relative_var = (1 - fraction) / hits + 1 / (k - 2)
+        return round(estimate), math.ceil(2 * estimate * math.sqrt(relative_var))
+
+    def memory_bytes(self):
+        return sum(s.itemsize * len(s) for level in self.levels for s in level.values())
+
+    def __len__(self):
+        return len(self.levels[0]) if self.levels else 0
@@ -0,0 +1,124 @@
+import gzip
+import json
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b'TPSNAP1\n'
+CHUNK_SIZE = 50_000
+
+# Entités nommées (id, name) et relations (paire d'entiers)
+NAMED = {'users': b'U', 'products': b'P'}
+PAIRS = {'follows': b'F', 'purchases': b'B'}
+END = b'E'
+FIELDS = {
+    'users': ('id', 'name'),
+    'products': ('id', 'name'),
+    'follows': ('follower_id', 'followee_id'),
+    'purchases': ('user_id', 'product_id')
+}
+KINDS = {v: k for k, v in {**NAMED, **PAIRS}.items()}
+
+_CHUNK_HEADER = struct.Struct('<cI')
+_NAMED_ROW = struct.Struct('<iH')
+
+
+def _int_array(data=b''):
+    arr = array('i')
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+class SnapshotWriter:
+    """Snapshot portable : flux gzip de blocs (type, nombre de lignes, données binaires).
+
+    Écrit dans un fichier temporaire renommé à la fermeture : un export interrompu ne laisse pas de snapshot.
+    """
+
+    def __init__(self, filepath, header=None):
+        self.filepath = filepath
+        self.tmp_path = filepath + '.tmp'
+        self.file = gzip.open(self.tmp_path, 'wb')
+        self.file.write(MAGIC)
+        self.file.write(json.dumps(header or {}).encode() + b'\n')
+        self.counts = {entity: 0 for entity in FIELDS}
+
+    def write(self, entity, rows):
+        if not rows:
+            return
+        if entity in NAMED:
+            payload = bytearray()
+            for row_id, name in rows:
+                encoded = (name or '').encode()
+                payload += _NAMED_ROW.pack(row_id, len(encoded)) + encoded
+            kind = NAMED[entity]
+        else:
+            arr = array('i', (v for pair in rows for v in pair))
+            if sys.byteorder == 'big':
+                arr.byteswap()
+            payload = arr.tobytes()
+            kind = PAIRS[entity]
+        self.file.write(_CHUNK_HEADER.pack(kind, len(rows)))
+        self.file.write(payload)
+        self.counts[entity] += len(rows)
+
+    def close(self):
+        self.file.write(_CHUNK_HEADER.pack(END, 0))
+        self.file.close()
+        os.replace(self.tmp_path, self.filepath)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_header(filepath):
+    with gzip.open(filepath, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filepath} n'est pas un snapshot")
+        return json.loads(f.readline())
+
+
+def iter_snapshot(filepath):
+    """Blocs (entité, [tuples]) dans l'ordre du fichier, un bloc en mémoire à la fois"""
+    with gzip.open(filepath, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filepath} n'est pas un snapshot")
+        f.readline()
+        while True:
+            kind, count = _CHUNK_HEADER.unpack(f.read(_CHUNK_HEADER.size))
+            if kind == END:
+                return
+            entity = KINDS[kind]
+            if entity in NAMED:
+                rows = []
+                for _ in range(count):
+                    row_id, length = _NAMED_ROW.unpack(f.read(_NAMED_ROW.size))
+                    rows.append((row_id, f.read(length).decode()))
+            else:
+                values = _int_array(f.read(8 * count))
+                rows = list(zip(values[::2], values[1::2]))
+            yield entity, rows
+
+
+def load_snapshot(filepath):
+    """Dataset complet (même format que dataset.json) relu depuis un snapshot"""
+    header = read_header(filepath)
+    data = {entity: [] for entity in FIELDS}
+    for entity, rows in iter_snapshot(filepath):
+        a, b = FIELDS[entity]
+        data[entity].extend({a: x, b: y} for x, y in rows)
+    data['params'] = {'source': filepath, 'snapshot_of': header}
+    return data
@@ -0,0 +1,56 @@
+import argparse
+import random
+import time
+from adapters import PartitionedAdapter
+from adapters.catalog import catalog_for
+from cli import generate_synthetic_data, record_result
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def timed(fn, *args):
+    start = time.time()
+    fn(*args)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Passage à l'échelle du moteur partitionné multi-processus")
+    parser.add_argument('--users', type=parse_list, default=[1_000_000, 10_000_000])
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--max-followers', type=int, default=20)
+    parser.add_argument('--workers', type=parse_list, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--batch', type=int, default=100, help="Nombre d'influenceurs du lot")
+    args = parser.parse_args()
+
+    for num_users in args.users:
+        data = generate_synthetic_data(num_users, args.products, args.max_followers)
+        # Empreinte calculée avant les mesures, sinon le premier nombre de workers la paierait
+        catalog_for(data)
+        sources = random.sample(range(1, num_users + 1), args.batch)
+        product_id = random.randint(1, args.products)
+
+        print(f"\n{'Workers':>8} {'Charg.':>9} {'Q1':>9} {'Q2':>9} {'Q3':>9} {'Q4':>9} {'Lot Q1':>9}")
+        print("─" * 68)
+        for workers in args.workers:
+            engine = PartitionedAdapter(workers)
+            load = timed(engine.reset_and_load, data)
+            timings = {
+                'query_1': timed(engine.query_1_products_by_followers, sources[0], args.depth),
+                'query_2': timed(engine.query_2_specific_product_influence, sources[0], product_id, args.depth),
+                'query_3': timed(engine.query_3_viral_product_disk, product_id, args.depth),
+                'query_4': timed(engine.query_4_viral_product_circle, product_id, args.depth),
+                'query_1_batch': timed(engine.query_1_batch, sources, args.depth)
+            }
+            engine.close()
+            print(f"{workers:>8} {load:>8.2f}s " + " ".join(f"{t:>8.3f}s" for t in timings.values()))
+            for query, elapsed in timings.items():
+                record_result({'kind': 'scaling', 'backend': 'Partitionné', 'workers': workers, 'users': num_users,
+                               'query': query, 'depth': args.depth, 'elapsed': elapsed, 'load': load})
+
+
+if __name__ == '__main__':
+    main()
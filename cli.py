@@ -1,12 +1,22 @@
 import json
 import time
 import random
-from adapters import MariaDBAdapter, Neo4jAdapter
+from adapters import (SCHEMA_LAYOUTS, InMemoryAdapter, MariaDBAdapter, Neo4jAdapter, PartitionedAdapter, Profiler,
+                      ReachabilityIndex, load_snapshot)
+from adapters.cache import cache_delta
+from adapters.catalog import catalog_for
+
+TOP_K = 10
+IN_PROCESS_ENGINES = ('Mémoire', 'Partitionné')
+BENCH_RESULTS_PATH = 'bench_results.jsonl'
+SNAPSHOT_PATH = 'snapshot.tpsnap'
 
 
 def load_data(filepath='dataset.json'):
     with open(filepath, 'r') as f:
-        return json.load(f)
+        data = json.load(f)
+    data.setdefault('params', {'source': filepath})
+    return data
 
 
 def generate_synthetic_data(num_users=1_000_000, num_products=10_000, max_followers=20):
@@ -34,7 +44,32 @@ def generate_synthetic_data(num_users=1_000_000, num_products=10_000, max_follow
             purchases.append({'user_id': user_id, 'product_id': product_id})
 
     print(f"  {len(follows):,} follows, {len(purchases):,} achats générés")
-    return {'users': users, 'products': products, 'follows': follows, 'purchases': purchases}
+    params = {
+        'generator': 'synthetic',
+        'num_users': num_users,
+        'num_products': num_products,
+        'max_followers': max_followers
+    }
+    return {'users': users, 'products': products, 'follows': follows, 'purchases': purchases, 'params': params}
+
+
+def record_result(entry, filepath=BENCH_RESULTS_PATH):
+    """Ajoute une mesure (chargement ou requête) au journal JSON Lines des benchmarks"""
+    entry = {'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'), **entry}
+    with open(filepath, 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def format_profile(prof):
+    delta = f"{prof['rss_delta_mb']:>+7.0f} Mo" if prof.get('rss_delta_mb') is not None else f"{'-':>10}"
+    workers = f" (+ workers {prof['workers_cpu']:.2f}s, {prof['workers_rss_mb']:.0f} Mo)" if 'workers_cpu' in prof else ""
+    return f"{prof['cpu']:>8.2f}s {delta}{workers}"
+
+
+def format_cache(cache):
+    if not cache or cache['hit_ratio'] is None:
+        return ""
+    return f" | cache {cache['hit_ratio']:.1%} hits ({cache['misses']:,} lectures disque)"
 
 
 def clear_screen():
@@ -56,54 +91,88 @@ def input_int(prompt, default=None):
             print("Veuillez entrer un nombre valide.")
 
 
+def input_ids(prompt, default):
+    """Lit une liste d'IDs du type "1,2,10-20" """
+    while True:
+        val = input(f"{prompt} [{default}]: ").strip() or default
+        try:
+            ids = []
+            for part in val.split(','):
+                if '-' in part:
+                    lo, hi = part.split('-')
+                    ids.extend(range(int(lo), int(hi) + 1))
+                else:
+                    ids.append(int(part))
+            return ids
+        except ValueError:
+            print("Veuillez entrer une liste valide (ex: 1,2,10-20).")
+
+
 class App:
     def __init__(self):
-        self.mariadb = None
-        self.neo4j = None
         self.data = None
         self.data_source = None
-        self.load_times = {'MariaDB': None, 'Neo4j': None}
-        self.enabled = {'MariaDB': True, 'Neo4j': True}
-        self._init_databases()
-
-    def _init_databases(self):
-        print("=" * 50)
-        print("   Connexion aux bases de données...")
-        print("=" * 50)
-
-        print("\nConnexion à MariaDB...")
-        try:
-            self.mariadb = MariaDBAdapter()
-            self.mariadb.connect()
-            print("  ✓ MariaDB connecté")
-        except Exception as e:
-            print(f"  ✗ MariaDB erreur"
-                  f": {e}")
-            self.mariadb = None
-
-        print("\nConnexion à Neo4j...")
-        try:
-            self.neo4j = Neo4jAdapter()
-            self.neo4j.connect()
-            print("  ✓ Neo4j connecté")
-        except Exception as e:
-            print(f"  ✗ Neo4j erreur: {e}")
-            self.neo4j = None
-
-        self._detect_existing_data()
-        pause()
+        self.memory = InMemoryAdapter()
+        self._adapters = {
+            'MariaDB': MariaDBAdapter(),
+            'Neo4j': Neo4jAdapter(),
+            'Mémoire': self.memory,
+            'Partitionné': PartitionedAdapter()
+        }
+        # None : connexion pas encore tentée (ouverte à la première utilisation)
+        self._connected = {'MariaDB': None, 'Neo4j': None, 'Mémoire': True, 'Partitionné': True}
+        self.load_times = {'MariaDB': None, 'Neo4j': None, 'Mémoire': None, 'Partitionné': None}
+        # Bases qui ont chargé le dataset courant (seules à recevoir l'index de reachability)
+        self.loaded = set()
+        self.enabled = {'MariaDB': True, 'Neo4j': True, 'Mémoire': False, 'Partitionné': False}
+        self.reach_index = None
+        self.reach_index_config = None
+        self.profiler = Profiler()
+        for db in self._adapters.values():
+            db.profiler = self.profiler
+        # Détection des données existantes différée à la première requête : aucune connexion au démarrage
+        self._detected = False
+
+    @property
+    def mariadb(self):
+        return self._connect('MariaDB')
+
+    @property
+    def neo4j(self):
+        return self._connect('Neo4j')
+
+    def _connect(self, db_name):
+        if self._connected[db_name] is None:
+            print(f"\nConnexion à {db_name}...")
+            try:
+                self._adapters[db_name].connect()
+                self._connected[db_name] = True
+                print(f"  ✓ {db_name} connecté")
+            except Exception as e:
+                self._connected[db_name] = False
+                print(f"  ✗ {db_name} erreur: {e}")
+        return self._adapters[db_name] if self._connected[db_name] else None
 
-    def _detect_existing_data(self):
-        stats = None
-        source_db = None
+    def _backends(self):
+        # Une base désactivée n'est pas connectée
+        for db_name in self._adapters:
+            yield db_name, self._connect(db_name) if self.enabled[db_name] else None
 
-        for db_name, db in [("MariaDB", self.mariadb), ("Neo4j", self.neo4j)]:
+    def _find_existing_data(self, verify=False):
+        for db_name in ("MariaDB", "Neo4j"):
+            if not self.enabled[db_name]:
+                continue
+            db = self._connect(db_name)
             if db:
-                s = db.get_stats()
+                s = db.get_stats(verify=verify)
                 if s and s['users'] > 0:
-                    stats = s
-                    source_db = db_name
-                    break
+                    return db_name, s
+        return None, None
+
+    def _detect_existing_data(self):
+        self._detected = True
+        print("\nDétection des données existantes...")
+        source_db, stats = self._find_existing_data()
 
         if stats:
             print(f"\n  ℹ Données existantes détectées dans {source_db}:")
@@ -121,17 +190,27 @@ class App:
             print("=" * 50)
             print("   COMPARAISON SQL / NoSQL - Réseau Social")
             print("=" * 50)
-            status_maria = "✓" if self.mariadb else "✗"
-            status_neo4j = "✓" if self.neo4j else "✗"
+            status = {None: "–", True: "✓", False: "✗"}
+            status_maria = status[self._connected['MariaDB']]
+            status_neo4j = status[self._connected['Neo4j']]
             enabled_maria = "ON" if self.enabled['MariaDB'] else "OFF"
             enabled_neo4j = "ON" if self.enabled['Neo4j'] else "OFF"
             time_maria = f" ({self.load_times['MariaDB']:.2f}s)" if self.load_times['MariaDB'] else ""
             time_neo4j = f" ({self.load_times['Neo4j']:.2f}s)" if self.load_times['Neo4j'] else ""
             print(f"\n   MariaDB: {status_maria} [{enabled_maria}]{time_maria}  |  Neo4j: {status_neo4j} [{enabled_neo4j}]{time_neo4j}")
+            engines = []
+            for db_name in IN_PROCESS_ENGINES:
+                enabled = "ON" if self.enabled[db_name] else "OFF"
+                load_time = f" ({self.load_times[db_name]:.2f}s)" if self.load_times[db_name] else ""
+                engines.append(f"{db_name}: [{enabled}]{load_time}")
+            print(f"   {'  |  '.join(engines)}")
             print(f"   Dataset: {self.data_source or 'Non chargé'}\n")
             print("   1. Choisir et charger le dataset")
             print("   2. Exécuter une requête")
             print("   3. Activer/Désactiver une base de données")
+            print("   4. Index de reachability (top influenceurs)")
+            tracing = "ON" if self.profiler.trace_allocations else "OFF"
+            print(f"   5. Profilage des allocations Python (tracemalloc) [{tracing}]")
             print("   0. Quitter")
             print()
 
@@ -143,6 +222,10 @@ class App:
                 self.menu_requetes()
             elif choix == '3':
                 self.menu_toggle_db()
+            elif choix == '4':
+                self.menu_reach_index()
+            elif choix == '5':
+                self.profiler.trace_allocations = not self.profiler.trace_allocations
             elif choix == '0':
                 self.quitter()
                 break
@@ -158,6 +241,8 @@ class App:
         print("\n   1. Utiliser les données existantes en base")
         print("   2. Dataset fichier (dataset.json)")
         print("   3. Dataset synthétique (1M users, 10K produits)")
+        print("   4. Exporter une base vers un snapshot")
+        print("   5. Snapshot (fichier) vers les bases activées")
         print("   0. Retour")
         print()
 
@@ -169,21 +254,18 @@ class App:
             self.charger_dataset_fichier()
         elif choix == '3':
             self.charger_dataset_synthetique()
+        elif choix == '4':
+            self.exporter_snapshot()
+        elif choix == '5':
+            self.charger_dataset_snapshot()
         elif choix == '0':
             return
 
     def charger_dataset_base_existante(self):
         clear_screen()
+        verify = input("Vérifier par un comptage réel plutôt que le catalogue ? (o/N): ").strip().lower() == 'o'
         print("Vérification des données existantes dans les bases...")
-        stats = None
-        source_db = None
-        for db_name, db in [("MariaDB", self.mariadb), ("Neo4j", self.neo4j)]:
-            if db:
-                s = db.get_stats()
-                if s and s['users'] > 0:
-                    stats = s
-                    source_db = db_name
-                    break
+        source_db, stats = self._find_existing_data(verify=verify)
 
         if stats:
             self.data = True
@@ -191,6 +273,8 @@ class App:
             print(f"\n  ✓ Données trouvées dans {source_db}:")
             print(f"    {stats['users']:,} users | {stats['products']:,} produits")
             print(f"    {stats['follows']:,} follows | {stats['purchases']:,} achats")
+            if 'fingerprint' in stats:
+                print(f"    Catalogue du {stats['created_at']} (empreinte {stats['fingerprint'][:12]}, paramètres {stats['params']})")
             print(f"\n  Dataset actif : {self.data_source}")
         else:
             print("\n  ✗ Aucune donnée trouvée dans les bases. Veuillez charger un fichier ou un dataset synthétique.")
@@ -200,7 +284,9 @@ class App:
         clear_screen()
         print("Chargement du dataset depuis fichier...")
         try:
-            self.data = load_data()
+            self.profiler.phases = []
+            with self.profiler.phase("lecture"):
+                self.data = load_data()
             self.data_source = f"Fichier ({len(self.data['users'])} users)"
             self._charger_bases()
         except Exception as e:
@@ -214,14 +300,55 @@ class App:
         max_followers = input_int("Max followers par user", 20)
 
         try:
-            self.data = generate_synthetic_data(num_users, num_products, max_followers)
+            self.profiler.phases = []
+            with self.profiler.phase("génération"):
+                self.data = generate_synthetic_data(num_users, num_products, max_followers)
             self.data_source = f"Synthétique ({num_users:,} users)"
             self._charger_bases()
         except Exception as e:
             print(f"Erreur: {e}")
             pause()
 
-    def _charger_bases(self):
+    def exporter_snapshot(self):
+        clear_screen()
+        print("Base source :")
+        print("   1. MariaDB")
+        print("   2. Neo4j")
+        print("   3. Mémoire")
+        db_name = {'1': 'MariaDB', '2': 'Neo4j', '3': 'Mémoire'}.get(input("Votre choix: ").strip())
+        db = self._connect(db_name) if db_name else None
+        if not db:
+            print("  ✗ Base indisponible.")
+            pause()
+            return
+        filepath = input(f"Fichier snapshot [{SNAPSHOT_PATH}]: ").strip() or SNAPSHOT_PATH
+
+        print(f"\nExport en flux de {db_name} vers {filepath}...")
+        try:
+            start = time.time()
+            counts = db.export_snapshot(filepath)
+            elapsed = time.time() - start
+            print(f"  ✓ {counts['users']:,} users | {counts['products']:,} produits"
+                  f" | {counts['follows']:,} follows | {counts['purchases']:,} achats en {elapsed:.2f}s")
+        except Exception as e:
+            print(f"Erreur: {e}")
+        pause()
+
+    def charger_dataset_snapshot(self):
+        clear_screen()
+        filepath = input(f"Fichier snapshot [{SNAPSHOT_PATH}]: ").strip() or SNAPSHOT_PATH
+        print("  ℹ Seules les bases activées sont rechargées (désactivez la base source pour une synchronisation).")
+        try:
+            self.profiler.phases = []
+            with self.profiler.phase("lecture"):
+                self.data = load_snapshot(filepath)
+            self.data_source = f"Snapshot {filepath} ({len(self.data['users']):,} users)"
+            self._charger_bases(only_enabled=True)
+        except Exception as e:
+            print(f"Erreur: {e}")
+            pause()
+
+    def _charger_bases(self, only_enabled=False):
         stats = {
             'users': len(self.data['users']),
             'products': len(self.data['products']),
@@ -236,36 +363,68 @@ class App:
         print(f"   {stats['follows']:,} follows | {stats['purchases']:,} achats")
         print("\n" + "─" * 50)
 
-        print(f"\n{'Base':<12} {'Temps':>10} {'Users/s':>12} {'Follows/s':>12}")
-        print("─" * 50)
+        mariadb = self.mariadb if self.enabled['MariaDB'] or not only_enabled else None
+        neo4j = self.neo4j if self.enabled['Neo4j'] or not only_enabled else None
+
+        if mariadb:
+            mariadb.layout = self._choisir_schema()
 
-        if self.mariadb:
+        self.loaded = set()
+
+        # Empreinte calculée une fois ici : sinon la première base chargée la paierait dans son temps d'import
+        with self.profiler.phase("catalogue") as prof:
+            catalog_for(self.data)
+        print(f"\nCatalogue du dataset (empreinte) : {prof['wall']:.2f}s")
+
+        print(f"\n{'Base':<12} {'Temps':>10} {'Users/s':>12} {'Follows/s':>12} {'CPU':>9} {'ΔRSS':>10}")
+        print("─" * 70)
+
+        if mariadb:
             try:
-                start = time.time()
-                self.mariadb.reset_and_load(self.data)
-                elapsed = time.time() - start
+                with self.profiler.phase("MariaDB") as prof:
+                    start = time.time()
+                    mariadb.reset_and_load(self.data)
+                    elapsed = time.time() - start
                 self.load_times['MariaDB'] = elapsed
                 users_per_sec = stats['users'] / elapsed
                 follows_per_sec = stats['follows'] / elapsed
-                print(f"{'MariaDB':<12} {elapsed:>9.2f}s {users_per_sec:>11,.0f} {follows_per_sec:>11,.0f}")
+                print(f"{'MariaDB':<12} {elapsed:>9.2f}s {users_per_sec:>11,.0f} {follows_per_sec:>11,.0f} {format_profile(prof)}")
+                record_result({'kind': 'load', 'backend': 'MariaDB', 'elapsed': elapsed, 'dataset': self.data_source,
+                               'layout': mariadb.layout, 'profile': prof, **stats})
+                self.loaded.add('MariaDB')
             except Exception as e:
                 print(f"{'MariaDB':<12} ERREUR: {e}")
                 self.load_times['MariaDB'] = None
 
-        if self.neo4j:
+        if neo4j:
             try:
-                start = time.time()
-                self.neo4j.reset_and_load(self.data)
-                elapsed = time.time() - start
+                with self.profiler.phase("Neo4j") as prof:
+                    start = time.time()
+                    neo4j.reset_and_load(self.data)
+                    elapsed = time.time() - start
                 self.load_times['Neo4j'] = elapsed
                 users_per_sec = stats['users'] / elapsed
                 follows_per_sec = stats['follows'] / elapsed
-                print(f"{'Neo4j':<12} {elapsed:>9.2f}s {users_per_sec:>11,.0f} {follows_per_sec:>11,.0f}")
+                print(f"{'Neo4j':<12} {elapsed:>9.2f}s {users_per_sec:>11,.0f} {follows_per_sec:>11,.0f} {format_profile(prof)}")
+                record_result({'kind': 'load', 'backend': 'Neo4j', 'elapsed': elapsed, 'dataset': self.data_source,
+                               'profile': prof, **stats})
+                self.loaded.add('Neo4j')
             except Exception as e:
                 print(f"{'Neo4j':<12} ERREUR: {e}")
                 self.load_times['Neo4j'] = None
 
-        print("─" * 50)
+        for db_name in IN_PROCESS_ENGINES:
+            if self.enabled[db_name]:
+                self._charger_moteur(db_name, stats)
+
+        print("─" * 70)
+
+        print("\nProfil par phase (CPU et RSS du processus client) :")
+        self.profiler.report()
+        record_result({'kind': 'profile', 'dataset': self.data_source, 'phases': self.profiler.phases})
+
+        if self.reach_index_config:
+            self._construire_index()
 
         if self.load_times['MariaDB'] and self.load_times['Neo4j']:
             if self.load_times['MariaDB'] < self.load_times['Neo4j']:
@@ -277,7 +436,82 @@ class App:
 
         pause()
 
+    def _choisir_schema(self):
+        layouts = list(SCHEMA_LAYOUTS)
+        print("\nSchéma MariaDB :")
+        for i, name in enumerate(layouts, 1):
+            print(f"   {i}. {name:<20} {SCHEMA_LAYOUTS[name]['description']}")
+        current = layouts.index(self.mariadb.layout) + 1
+        while True:
+            choix = input_int("Votre choix", current)
+            if 1 <= choix <= len(layouts):
+                return layouts[choix - 1]
+            print("Choix invalide.")
+
+    def _charger_moteur(self, db_name, stats):
+        try:
+            db = self._adapters[db_name]
+            with self.profiler.phase(db_name, db.resource_usage) as prof:
+                start = time.time()
+                db.reset_and_load(self.data)
+                elapsed = time.time() - start
+            self.load_times[db_name] = elapsed
+            users_per_sec = stats['users'] / elapsed
+            follows_per_sec = stats['follows'] / elapsed
+            print(f"{db_name:<12} {elapsed:>9.2f}s {users_per_sec:>11,.0f} {follows_per_sec:>11,.0f} {format_profile(prof)}")
+            self.loaded.add(db_name)
+        except Exception as e:
+            print(f"{db_name:<12} ERREUR: {e}")
+            self.load_times[db_name] = None
+
+    def _construire_index(self):
+        top_users, max_depth = self.reach_index_config
+        print(f"\nConstruction de l'index de reachability ({top_users} users, profondeur {max_depth})...")
+        self.reach_index = ReachabilityIndex(top_users, max_depth).build(self.data['follows'])
+        for db_name, db in self._adapters.items():
+            db.set_reach_index(self.reach_index if db_name in self.loaded else None)
+        print(f"  ✓ {len(self.reach_index)} users indexés en {self.reach_index.build_time:.2f}s"
+              f" ({self.reach_index.memory_bytes() / 1024 / 1024:.1f} Mo)")
+
+    def menu_reach_index(self):
+        clear_screen()
+        print("=" * 50)
+        print("   INDEX DE REACHABILITY")
+        print("=" * 50)
+        if self.reach_index:
+            print(f"\n   Actif : {len(self.reach_index)} users, profondeur max {self.reach_index.max_depth}")
+            print(f"   Construit en {self.reach_index.build_time:.2f}s, {self.reach_index.memory_bytes() / 1024 / 1024:.1f} Mo")
+        else:
+            print("\n   Inactif")
+        print("\n   1. Construire / reconstruire l'index")
+        print("   2. Désactiver l'index")
+        print("   0. Retour")
+        print()
+
+        choix = input("Votre choix: ").strip()
+
+        if choix == '1':
+            top_users = input_int("Nombre d'utilisateurs les plus suivis", 100)
+            max_depth = input_int("Profondeur max indexée", 3)
+            self.reach_index_config = (top_users, max_depth)
+            if isinstance(self.data, dict):
+                self._construire_index()
+            else:
+                print("\n  ℹ Index construit au prochain chargement de dataset (arêtes non disponibles en mémoire).")
+            pause()
+        elif choix == '2':
+            self.reach_index = None
+            self.reach_index_config = None
+            for db in self._adapters.values():
+                db.set_reach_index(None)
+            print("  → Index désactivé.")
+            pause()
+
     def menu_requetes(self):
+        if not self.data and not self._detected:
+            self._detect_existing_data()
+            if self.data:
+                pause()
         if not self.data:
             print("\nVeuillez d'abord charger un dataset.")
             pause()
@@ -292,6 +526,8 @@ class App:
             print("   2. Influence sur un produit spécifique (post)")
             print("   3. Viralité d'un produit (disque orienté niveau n)")
             print("   4. Viralité d'un produit (cercle orienté niveau n)")
+            print("   5. Produits achetés par le réseau - en lot (plusieurs influenceurs)")
+            print("   6. Influence sur des produits spécifiques - en lot")
             print("   0. Retour")
             print()
 
@@ -305,6 +541,10 @@ class App:
                 self.executer_query(3)
             elif choix == '4':
                 self.executer_query(4)
+            elif choix == '5':
+                self.executer_batch(1)
+            elif choix == '6':
+                self.executer_batch(2)
             elif choix == '0':
                 break
 
@@ -333,39 +573,63 @@ class App:
             level = input_int("Niveau exact (0, 1, 2...)", 2)
             params = (product_id, level)
 
+        approximate = False
+        if query_num in (1, 2) and self.enabled['Mémoire']:
+            choix = input("Mode approché (échantillon bottom-k) pour le moteur mémoire ? (o/N): ").strip().lower()
+            approximate = choix == 'o'
+        if approximate and self.memory.sketches is None:
+            # Précalcul une fois par dataset, hors de la mesure des requêtes
+            print("Construction des échantillons du moteur mémoire...")
+            sketches = self.memory.build_sketches()
+            print(f"  ✓ Profondeur max {sketches.max_depth}, k = {sketches.k}, {sketches.build_time:.2f}s"
+                  f" ({sketches.memory_bytes() / 1024 / 1024:.1f} Mo)")
+
+        cache_mode = self._choisir_cache()
+
         print("\n" + "─" * 50)
         print("Exécution (séquentiel)...")
 
         def run_query(db_name, db):
-            start = time.time()
-            if query_num == 1:
-                result = db.query_1_products_by_followers(*params)
+            cache_state = self._preparer_cache(db_name, db, cache_mode)
+            before = db.cache_counters()
+            with self.profiler.phase(f"{db_name}/query_{query_num}", db.resource_usage) as prof:
+                start = time.time()
+                result = call_query(db)
+                elapsed = time.time() - start
+            cache = cache_delta(before, db.cache_counters())
+            return db_name, result, elapsed, prof, {'cache_state': cache_state, 'cache': cache}
+
+        def call_query(db):
+            if query_num == 1 and approximate and db is self.memory:
+                return db.query_1_products_by_followers(*params, approximate=True)[:TOP_K + 1]
+            elif query_num == 1:
+                # Une ligne de plus que l'affichage pour savoir s'il reste des produits
+                return db.query_1_top_products(*params, limit=TOP_K + 1)
             elif query_num == 2:
-                result = db.query_2_specific_product_influence(*params)
+                if approximate and db is self.memory:
+                    return db.query_2_specific_product_influence(*params, approximate=True)
+                return db.query_2_specific_product_influence(*params)
             elif query_num == 3:
-                result = db.query_3_viral_product_disk(*params)
+                return db.query_3_viral_product_disk(*params)
             elif query_num == 4:
-                result = db.query_4_viral_product_circle(*params)
-            elapsed = time.time() - start
-            return db_name, result, elapsed
+                return db.query_4_viral_product_circle(*params)
 
         results = {}
-        for db_name, db in [("MariaDB", self.mariadb), ("Neo4j", self.neo4j)]:
+        for db_name, db in self._backends():
             if db and self.enabled[db_name]:
                 try:
-                    db_name, result, elapsed = run_query(db_name, db)
-                    results[db_name] = {'result': result, 'elapsed': elapsed}
+                    db_name, result, elapsed, prof, cache = run_query(db_name, db)
+                    results[db_name] = {'result': result, 'elapsed': elapsed, 'profile': prof, 'cache': cache}
                 except Exception as e:
                     results[db_name] = {'error': str(e)}
 
-        for db_name in ["MariaDB", "Neo4j"]:
-            db_obj = self.mariadb if db_name == "MariaDB" else self.neo4j
-            if not db_obj:
-                print(f"\n{db_name}: Non connecté")
-                continue
+        for db_name, db_obj in self._backends():
             if not self.enabled[db_name]:
                 print(f"\n{db_name}: Désactivé")
                 continue
+            if not db_obj:
+                print(f"\n{db_name}: Non connecté")
+                continue
             if db_name not in results:
                 print(f"\n{db_name}: Non disponible")
                 continue
@@ -376,19 +640,115 @@ class App:
                 print(f"  Erreur: {r['error']}")
             else:
                 result, elapsed = r['result'], r['elapsed']
+                record_result(self._measure_entry(db_name, db_obj, f"query_{query_num}", params, elapsed,
+                                                  approximate=approximate and db_obj is self.memory,
+                                                  profile=r['profile'], **r['cache']))
                 if query_num == 1:
-                    for item in result[:10]:
-                        print(f"  • {item['name']}: {item['buyers_count']} acheteurs")
-                    if len(result) > 10:
-                        print(f"  ... et {len(result) - 10} autres")
+                    for item in result[:TOP_K]:
+                        margin = f" (±{item['error_margin']})" if 'error_margin' in item else ""
+                        print(f"  • {item['name']}: {item['buyers_count']}{margin} acheteurs")
+                    if len(result) > TOP_K:
+                        print("  ... et d'autres produits")
                 elif query_num == 2:
-                    print(f"  → Acheteurs influencés: {result[0]['buyers_count']}")
+                    margin = f" (±{result[0]['error_margin']})" if 'error_margin' in result[0] else ""
+                    print(f"  → Acheteurs influencés: {result[0]['buyers_count']}{margin}")
                 elif query_num in (3, 4):
                     print(f"  → Acheteurs viraux au niveau {params[1]}: {result[0]['viral_buyers']}")
-                print(f"  {elapsed:.4f}s")
+                print(f"  {elapsed:.4f}s | CPU {format_profile(r['profile'])}{format_cache(r['cache']['cache'])}"
+                      f" [{r['cache']['cache_state']}]")
+
+        pause()
+
+    def executer_batch(self, query_num):
+        clear_screen()
+
+        if query_num == 1:
+            print("--- Produits achetés par le réseau de followers (en lot) ---\n")
+            user_ids = input_ids("IDs utilisateurs", "1-100")
+            depth = input_int("Profondeur (niveau 1 à n)", 2)
+            params = (user_ids, depth)
+        else:
+            print("--- Influence sur des produits spécifiques (en lot) ---\n")
+            user_ids = input_ids("IDs utilisateurs", "1-100")
+            product_ids = input_ids("IDs produits", "1-10")
+            depth = input_int("Profondeur (niveau 1 à n)", 2)
+            params = (user_ids, product_ids, depth)
+
+        cache_mode = self._choisir_cache()
+
+        print("\n" + "─" * 50)
+        print(f"Exécution en lot ({len(user_ids)} influenceurs)...")
+
+        for db_name, db in self._backends():
+            if not self.enabled[db_name]:
+                print(f"\n{db_name}: Désactivé")
+                continue
+            if not db:
+                print(f"\n{db_name}: Non connecté")
+                continue
+
+            print(f"\n{db_name}:")
+            try:
+                cache_state = self._preparer_cache(db_name, db, cache_mode)
+                before = db.cache_counters()
+                with self.profiler.phase(f"{db_name}/query_{query_num}_batch", db.resource_usage) as prof:
+                    start = time.time()
+                    if query_num == 1:
+                        result = db.query_1_batch(*params)
+                    else:
+                        result = db.query_2_batch(*params)
+                    elapsed = time.time() - start
+                cache = cache_delta(before, db.cache_counters())
+            except Exception as e:
+                print(f"  Erreur: {e}")
+                continue
+
+            if query_num == 1:
+                reached = sum(1 for rows in result.values() if rows)
+                print(f"  → {reached}/{len(result)} influenceurs avec au moins un produit acheté par leur réseau")
+            else:
+                totals = {}
+                for per_product in result.values():
+                    for product_id, count in per_product.items():
+                        totals[product_id] = totals.get(product_id, 0) + count
+                for product_id, total in list(totals.items())[:TOP_K]:
+                    print(f"  • Produit {product_id}: {total} acheteurs influencés (cumul)")
+            print(f"  {elapsed:.4f}s ({len(result) / elapsed:,.1f} influenceurs/s) | CPU {format_profile(prof)}"
+                  f"{format_cache(cache)} [{cache_state}]")
+            record_result(self._measure_entry(db_name, db, f"query_{query_num}_batch", params, elapsed, profile=prof,
+                                              cache_state=cache_state, cache=cache))
 
         pause()
 
+    def _choisir_cache(self):
+        print("\nÉtat du cache avant la mesure :")
+        print("   1. Tel quel (non contrôlé)")
+        print("   2. Chaud (follows / purchases parcourus avant la requête)")
+        print("   3. Froid (redémarrage du conteneur docker local)")
+        return {'2': 'chaud', '3': 'froid'}.get(input("\nChoix (défaut 1): ").strip(), 'tel quel')
+
+    def _preparer_cache(self, db_name, db, cache_mode):
+        """Met la base dans l'état de cache demandé et renvoie l'état effectivement obtenu"""
+        if cache_mode == 'chaud':
+            print(f"  Préchauffage de {db_name}...")
+            db.warm_up()
+        elif cache_mode == 'froid':
+            print(f"  Démarrage à froid de {db_name}...")
+            try:
+                if not db.cold_start():
+                    return 'tel quel'
+            except Exception as e:
+                print(f"  ✗ Démarrage à froid impossible: {e}")
+                return 'tel quel'
+        return cache_mode
+
+    def _measure_entry(self, db_name, db, query, params, elapsed, **extra):
+        entry = {'kind': 'query', 'backend': db_name, 'query': query, 'params': params, 'elapsed': elapsed,
+                 'dataset': self.data_source, **extra}
+        if db is self._adapters['MariaDB']:
+            entry['layout'] = db.layout
+        return entry
+
     def menu_toggle_db(self):
         while True:
             clear_screen()
@@ -397,8 +757,12 @@ class App:
             print("=" * 50)
             maria_state = "ON ✓" if self.enabled['MariaDB'] else "OFF ✗"
             neo4j_state = "ON ✓" if self.enabled['Neo4j'] else "OFF ✗"
+            memory_state = "ON ✓" if self.enabled['Mémoire'] else "OFF ✗"
+            partitioned_state = "ON ✓" if self.enabled['Partitionné'] else "OFF ✗"
             print(f"\n   1. MariaDB  [{maria_state}]")
             print(f"   2. Neo4j    [{neo4j_state}]")
+            print(f"   3. Mémoire  [{memory_state}]")
+            print(f"   4. Partitionné ({self._adapters['Partitionné'].num_workers} workers) [{partitioned_state}]")
             print("   0. Retour")
             print()
 
@@ -414,6 +778,18 @@ class App:
                 state = "activé" if self.enabled['Neo4j'] else "désactivé"
                 print(f"  → Neo4j {state}.")
                 pause()
+            elif choix in ('3', '4'):
+                db_name = IN_PROCESS_ENGINES[int(choix) - 3]
+                self.enabled[db_name] = not self.enabled[db_name]
+                state = "activé" if self.enabled[db_name] else "désactivé"
+                print(f"  → Moteur {db_name} {state}.")
+                db = self._adapters[db_name]
+                if self.enabled[db_name] and isinstance(self.data, dict) and not db.get_stats()['users']:
+                    self._charger_moteur(db_name, {'users': len(self.data['users']), 'follows': len(self.data['follows'])})
+                    # Chargé avec le dataset courant : l'index déjà construit lui correspond
+                    if db_name in self.loaded:
+                        db.set_reach_index(self.reach_index)
+                pause()
             elif choix == '0':
                 break
             else:
@@ -421,10 +797,9 @@ class App:
                 pause()
 
     def quitter(self):
-        if self.mariadb:
-            self.mariadb.close()
-        if self.neo4j:
-            self.neo4j.close()
+        for db_name, db in self._adapters.items():
+            if self._connected[db_name]:
+                db.close()
 
 
 def main():
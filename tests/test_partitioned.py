@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from adapters import InMemoryAdapter, PartitionedAdapter
+
+DEPTH = 3
+SOURCES = list(range(1, 13))
+PRODUCTS = [1, 2, 3, 4, 5]
+
+
+def synthetic_data(num_users=2000, num_products=50, max_followers=10, seed=42):
+    rng = random.Random(seed)
+    follows = set()
+    for user_id in range(1, num_users + 1):
+        for follower in rng.sample(range(1, num_users + 1), rng.randint(0, max_followers)):
+            if follower != user_id:
+                follows.add((follower, user_id))
+    purchases = {(rng.randint(1, num_users), rng.randint(1, num_products)) for _ in range(num_users * 2)}
+    return {
+        'users': [{'id': i, 'name': f'User_{i}'} for i in range(1, num_users + 1)],
+        'products': [{'id': i, 'name': f'Product_{i}'} for i in range(1, num_products + 1)],
+        'follows': [{'follower_id': a, 'followee_id': b} for a, b in sorted(follows)],
+        'purchases': [{'user_id': u, 'product_id': p} for u, p in sorted(purchases)]
+    }
+
+
+@pytest.fixture(scope='module')
+def engines():
+    data = synthetic_data()
+    memory = InMemoryAdapter()
+    memory.reset_and_load(data)
+    partitioned = PartitionedAdapter(workers=3)
+    partitioned.reset_and_load(data)
+    yield memory, partitioned
+    partitioned.close()
+
+
+def test_query_1_batch_matches_memory(engines):
+    memory, partitioned = engines
+    batch = partitioned.query_1_batch(SOURCES, DEPTH)
+    assert batch == memory.query_1_batch(SOURCES, DEPTH)
+    for user_id in SOURCES:
+        assert batch[user_id] == partitioned.query_1_products_by_followers(user_id, DEPTH)
+
+
+def test_query_2_batch_matches_memory(engines):
+    memory, partitioned = engines
+    batch = partitioned.query_2_batch(SOURCES, PRODUCTS, DEPTH)
+    assert batch == memory.query_2_batch(SOURCES, PRODUCTS, DEPTH)
+    for user_id in SOURCES:
+        for product_id in PRODUCTS:
+            expected = memory.query_2_specific_product_influence(user_id, product_id, DEPTH)[0]['buyers_count']
+            assert batch[user_id][product_id] == expected
@@ -0,0 +1,42 @@
+import pytest
+
+from adapters import InMemoryAdapter
+from adapters.sketch import hash_64, unhash_64
+
+from .test_partitioned import synthetic_data
+
+
+def test_unhash_inverts_hash():
+    for value in (0, 1, 42, 2 ** 31 - 1, 123456789):
+        assert unhash_64(hash_64(value)) == value
+
+
+@pytest.fixture(scope='module')
+def memory():
+    engine = InMemoryAdapter()
+    engine.reset_and_load(synthetic_data())
+    engine.build_sketches()
+    return engine
+
+
+def test_small_networks_are_exact(memory):
+    # Profondeur 1 : au plus 10 followers, moins que k, l'échantillon est le réseau entier
+    for user_id in range(1, 50):
+        exact = memory.query_1_products_by_followers(user_id, 1)
+        approx = memory.query_1_products_by_followers(user_id, 1, approximate=True)
+        assert [(r['id'], r['buyers_count']) for r in approx] == [(r['id'], r['buyers_count']) for r in exact]
+        assert all(r['error_margin'] == 0 for r in approx)
+
+
+def test_estimates_within_margin(memory):
+    misses = 0
+    for user_id in range(1, 101):
+        exact = memory.query_2_specific_product_influence(user_id, 1, 4)[0]['buyers_count']
+        approx = memory.query_2_specific_product_influence(user_id, 1, 4, approximate=True)[0]
+        misses += abs(approx['buyers_count'] - exact) > approx['error_margin']
+    assert misses <= 10
+
+
+def test_depth_beyond_sketches_is_rejected(memory):
+    with pytest.raises(ValueError):
+        memory.query_2_specific_product_influence(1, 1, memory.sketches.max_depth + 1, approximate=True)